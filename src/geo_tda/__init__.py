@@ -9,7 +9,10 @@ This package provides tools for:
 """
 
 __all__ = [
+    'covariates',
     'data_acquisition',
     'geoio_utils',
+    'hydrology',
+    'tda',
     'utils',
 ]
\ No newline at end of file
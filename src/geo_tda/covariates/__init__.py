@@ -0,0 +1,20 @@
+"""
+Chunked terrain covariates computed from the aligned DEM.
+"""
+
+from .terrain import terrain_derivatives
+from .relief import local_relief, relief_stack, window_pixels
+from .roughness import default_halo, roughness_stack, wavelet_roughness
+
+__all__ = [
+    # Terrain derivatives
+    'terrain_derivatives',
+    # Local relief
+    'local_relief',
+    'relief_stack',
+    'window_pixels',
+    # Wavelet roughness
+    'wavelet_roughness',
+    'roughness_stack',
+    'default_halo',
+]
@@ -0,0 +1,183 @@
+"""
+Multi-window local relief with van Herk / Gil-Werman running extrema.
+
+Local relief over a w x w window is max - min of the window. The notebook
+runs `scipy.ndimage.maximum_filter` / `minimum_filter` once per entry of
+`RELIEF_WINDOWS_M`, so the cost grows with every window and every size
+starts over from the DEM.
+
+The van Herk / Gil-Werman algorithm computes a running maximum of any
+width with three comparisons per pixel: the axis is cut into blocks of the
+window width, a forward and a backward cumulative maximum are taken inside
+each block, and every window (which spans at most two blocks) is the
+maximum of one backward and one forward value. Square windows are
+separable into a row pass and a column pass; the row kernel is compiled
+with Numba when available (see `geo_tda.utils.jit`).
+
+Nested windows reuse each other: the maximum over a w2 window equals the
+maximum, over a (w2 - w1 + 1) window, of the w1-window maxima. Sizes are
+processed in increasing order, each starting from the previous result, so
+all requested windows cost one sweep per size with constant work per pixel
+regardless of width.
+
+Nodata cells never win a max / min (they count as -inf / +inf), cells
+outside the raster are ignored (equivalent to the notebook's 'reflect'
+mode), and relief is NaN where the centre cell is nodata.
+
+Typical usage:
+    from geo_tda.covariates import local_relief
+
+    relief = local_relief("dem_aligned.tif", [90, 450, 1500], map_units=True)
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+from geo_tda.utils.jit import njit
+
+
+@njit(cache=True)
+def _running_max_rows(a: np.ndarray, size: int) -> np.ndarray:
+    """Centred running maximum of odd width `size` along rows (van Herk / Gil-Werman)."""
+    nrows, n = a.shape
+    r = size // 2
+    length = -(-(n + 2 * r) // size) * size
+    out = np.empty_like(a)
+    padded = np.full(length, -np.inf, dtype=a.dtype)
+    forward = np.empty(length, dtype=a.dtype)
+    backward = np.empty(length, dtype=a.dtype)
+    for i in range(nrows):
+        padded[r:r + n] = a[i]
+        for start in range(0, length, size):
+            forward[start] = padded[start]
+            for k in range(start + 1, start + size):
+                forward[k] = max(forward[k - 1], padded[k])
+            end = start + size - 1
+            backward[end] = padded[end]
+            for k in range(end - 1, start - 1, -1):
+                backward[k] = max(backward[k + 1], padded[k])
+        # The window of output x covers padded [x, x + size - 1]: at most two blocks
+        for x in range(n):
+            out[i, x] = max(backward[x], forward[x + size - 1])
+    return out
+
+
+@njit(cache=True)
+def _running_max_cols(a: np.ndarray, size: int) -> np.ndarray:
+    """Column counterpart of `_running_max_rows`, sweeping whole rows at a time."""
+    n, ncols = a.shape
+    r = size // 2
+    length = -(-(n + 2 * r) // size) * size
+    padded = np.full((length, ncols), -np.inf, dtype=a.dtype)
+    padded[r:r + n] = a
+    forward = np.empty_like(padded)
+    backward = np.empty_like(padded)
+    for start in range(0, length, size):
+        forward[start] = padded[start]
+        for k in range(start + 1, start + size):
+            for j in range(ncols):
+                forward[k, j] = max(forward[k - 1, j], padded[k, j])
+        end = start + size - 1
+        backward[end] = padded[end]
+        for k in range(end - 1, start - 1, -1):
+            for j in range(ncols):
+                backward[k, j] = max(backward[k + 1, j], padded[k, j])
+    out = np.empty_like(a)
+    for x in range(n):
+        for j in range(ncols):
+            out[x, j] = max(backward[x, j], forward[x + size - 1, j])
+    return out
+
+
+def _square_max(a: np.ndarray, size: int) -> np.ndarray:
+    """Separable square running maximum: a row pass, then a column pass."""
+    if size == 1:
+        return a
+    return _running_max_cols(_running_max_rows(a, size), size)
+
+
+def relief_stack(block: np.ndarray, windows: Sequence[int]) -> List[np.ndarray]:
+    """
+    Relief of a 2D array for several odd window sizes in one nested sweep.
+
+    Args:
+        block: 2D elevation array; NaN is nodata.
+        windows: Odd window widths in pixels.
+
+    Returns:
+        List of float32 relief arrays in the order of `windows`.
+    """
+    nodata = np.isnan(block)
+    hi = np.where(nodata, -np.inf, block)
+    lo = np.where(nodata, -np.inf, -block)
+    prev = 1
+    results = {}
+    for w in sorted(set(windows)):
+        step = w - prev + 1
+        hi = _square_max(hi, step)
+        lo = _square_max(lo, step)
+        prev = w
+        relief = (hi + lo).astype(np.float32)
+        relief[nodata] = np.nan
+        results[w] = relief
+    return [results[w] for w in windows]
+
+
+def window_pixels(window: float, cellsize: float) -> int:
+    """Odd window width in pixels for a map-unit width (at least 3, as in the notebook)."""
+    pixels = max(3, int(round(window / cellsize)))
+    return pixels + (pixels % 2 == 0)
+
+
+def local_relief(
+    dem,
+    windows: Sequence[float],
+    map_units: bool = False,
+    cellsize: Optional[float] = None,
+    chunk_size: int = 2048,
+    out_path: Optional[Union[str, Path]] = None,
+    scheduler: Optional[str] = None,
+    compute: bool = True,
+):
+    """
+    Local relief (window max - min) for several window sizes in one pass.
+
+    A thin wrapper around `terrain_derivatives` with 'relief_<w>' bands, so
+    relief can also be fused with slope, curvature and TPI in one read.
+
+    Args:
+        dem: DEM path or 2D DataArray (see `terrain_derivatives`).
+        windows: Window widths; odd pixel counts, or map units with `map_units`.
+        map_units: Convert widths with `window_pixels` using the cell size;
+            widths that round to the same pixel count raise ValueError.
+        cellsize: Pixel size; defaults to the x coordinate spacing.
+        chunk_size, out_path, scheduler, compute: As in `terrain_derivatives`.
+
+    Returns:
+        float32 ('band', 'y', 'x') stack with one 'relief_<pixels>' band per window.
+    """
+    from .terrain import _dem_cellsize, terrain_derivatives
+
+    if map_units:
+        size = _dem_cellsize(dem, cellsize)
+        pixels = [window_pixels(w, size) for w in windows]
+        widths: dict = {}
+        for w, p in zip(windows, pixels):
+            widths.setdefault(p, []).append(w)
+        clashes = {p: ws for p, ws in widths.items() if len(ws) > 1}
+        if clashes:
+            detail = "; ".join(f"{ws} -> {p} px" for p, ws in clashes.items())
+            raise ValueError(f"Relief widths collide at cell size {size:g}: {detail}")
+    else:
+        pixels = [int(w) for w in windows]
+    return terrain_derivatives(
+        dem, [f"relief_{p}" for p in pixels], cellsize=cellsize, chunk_size=chunk_size,
+        out_path=out_path, scheduler=scheduler, compute=compute,
+    )
+
+
+__all__ = ['relief_stack', 'window_pixels', 'local_relief']
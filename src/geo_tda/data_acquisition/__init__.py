@@ -8,6 +8,7 @@ with atomic writes, authentication handling, and integrity validation.
 __all__ = [
     'build_dem_download_jobs_stac',
     'execute_downloads',
+    'convert_to_cog',
 ]
 
 # Lazy imports to avoid dependency issues
@@ -18,4 +19,7 @@ def __getattr__(name):
     elif name == 'execute_downloads':
         from .download_core import execute_downloads
         return execute_downloads
+    elif name == 'convert_to_cog':
+        from .cog import convert_to_cog
+        return convert_to_cog
     raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
\ No newline at end of file
@@ -0,0 +1,152 @@
+# src/data_acquisition/cog.py
+"""
+Post-download conversion of GeoTIFF tiles to Cloud Optimized GeoTIFFs.
+
+Tiles are served in whatever layout the provider chose, so quick-looks,
+coverage checks and pyramid steps read full-resolution strips. Rewriting
+each tile as a COG (internal tiling, compression with a predictor, and
+internal overviews) lets low-resolution reads touch only the overview
+levels.
+
+Each tile is converted in a worker process to a `.cog.part` file next to
+the original, verified (same grid and identical pixel checksums), moved
+over the original with an atomic rename, and the conversion is recorded in
+the tile's provenance sidecar. Tiles that are already COGs are skipped.
+"""
+
+from __future__ import annotations
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Iterable
+
+import rasterio
+from rasterio.shutil import copy as rio_copy
+from tqdm.auto import tqdm
+
+from geo_tda.geoio_utils.provenance import append_processing_step
+
+log = logging.getLogger(__name__)
+
+
+def is_cog(path: Path, compress: str = "DEFLATE") -> bool:
+    """
+    True if GDAL reports the file as a COG layout, or it is a tiled GeoTIFF
+    with overviews that is already compressed with `compress` and a predictor.
+    """
+    with rasterio.open(path) as src:
+        structure = src.tags(ns="IMAGE_STRUCTURE")
+        if structure.get("LAYOUT", "").upper() == "COG":
+            return True
+        if structure.get("COMPRESSION", "").upper() != compress.upper():
+            return False
+        if structure.get("PREDICTOR", "1") == "1":
+            return False
+        small = max(src.width, src.height) <= src.block_shapes[0][1]
+        return bool(src.profile.get("tiled")) and (small or bool(src.overviews(1)))
+
+
+def _convert_one(
+    path: str,
+    compress: str,
+    blocksize: int,
+    predictor: int | None,
+    overview_resampling: str,
+) -> str:
+    """Target function for a single conversion process."""
+    path = Path(path)
+    part_path = path.with_suffix(path.suffix + ".cog.part")
+    try:
+        if is_cog(path, compress):
+            return f"SKIP: {path.name} (already a COG)"
+
+        with rasterio.open(path) as src:
+            if predictor is None:
+                predictor = 3 if src.dtypes[0].startswith("float") else 2
+            before = {
+                "shape": src.shape, "crs": src.crs, "transform": src.transform,
+                "checksums": [src.checksum(b) for b in src.indexes],
+            }
+        original_size = path.stat().st_size
+        options = {
+            "COMPRESS": compress, "PREDICTOR": predictor, "BLOCKSIZE": blocksize,
+            "OVERVIEWS": "AUTO", "OVERVIEW_RESAMPLING": overview_resampling,
+            "BIGTIFF": "IF_SAFER",
+        }
+        rio_copy(path, part_path, driver="COG", **options)
+
+        with rasterio.open(part_path) as dst:
+            after = {
+                "shape": dst.shape, "crs": dst.crs, "transform": dst.transform,
+                "checksums": [dst.checksum(b) for b in dst.indexes],
+            }
+            n_overviews = len(dst.overviews(1))
+        if after != before:
+            raise ValueError("converted tile does not match the original grid or pixels")
+
+        os.replace(part_path, path)
+        append_processing_step(path, {
+            "step": "cog_conversion",
+            "parameters": {k.lower(): v for k, v in options.items()},
+            "results": {
+                "original_size_bytes": original_size,
+                "cog_size_bytes": path.stat().st_size,
+                "overview_levels": n_overviews,
+                "pixel_checksums_verified": True,
+            },
+        })
+        return f"OK: {path.name}"
+
+    except Exception as e:
+        if part_path.exists():
+            part_path.unlink()
+        return f"FAIL: {path.name} ({e})"
+
+
+def convert_to_cog(
+    paths: Iterable[Path],
+    max_workers: int | None = None,
+    compress: str = "DEFLATE",
+    blocksize: int = 512,
+    predictor: int | None = None,
+    overview_resampling: str = "average",
+) -> list[str]:
+    """
+    Rewrites GeoTIFF tiles in place as COGs using a pool of processes.
+
+    Args:
+        paths: GeoTIFF files to convert (COGs are skipped).
+        max_workers: Worker processes; defaults to the CPU count.
+        compress: COG compression.
+        blocksize: Internal tile size in pixels.
+        predictor: TIFF predictor; None uses 3 for floating point and 2 for integers.
+        overview_resampling: Resampling for the internal overviews.
+
+    Returns:
+        One "OK: ...", "SKIP: ..." or "FAIL: ..." message per file.
+    """
+    paths = [Path(p) for p in paths]
+    if not paths:
+        log.info("No tiles to convert to COG.")
+        return []
+
+    log.info(f"🗜️  Converting {len(paths)} tiles to COG...")
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(_convert_one, str(p), compress, blocksize, predictor, overview_resampling)
+            for p in paths
+        ]
+        results = [
+            future.result()
+            for future in tqdm(as_completed(futures), total=len(futures), desc="COG conversion", unit="file")
+        ]
+
+    failures = [r for r in results if r.startswith("FAIL")]
+    log.info(
+        f"COG conversion: {sum(r.startswith('OK') for r in results)} converted, "
+        f"{sum(r.startswith('SKIP') for r in results)} already COG, {len(failures)} failed"
+    )
+    for f in failures:
+        log.error(f"  - {f}")
+    return results
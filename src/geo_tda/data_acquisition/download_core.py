@@ -108,9 +108,19 @@ def _download_job(job: dict, stats: dict) -> str:
                 stats["failed"] += 1
 
 
-def execute_downloads(jobs: list[dict], description: str, max_workers: int):
+def execute_downloads(
+    jobs: list[dict],
+    description: str,
+    max_workers: int,
+    convert_cog: bool = False,
+    cog_options: dict | None = None,
+):
     """
     Manages a pool of threads to download a list of files concurrently.
+
+    With `convert_cog`, every downloaded or already valid GeoTIFF is then
+    rewritten in place as a COG (see `convert_to_cog`; `cog_options` are
+    passed through).
     """
     if not jobs:
         log.info(f"No new files to download for {description}.")
@@ -127,15 +137,17 @@ def execute_downloads(jobs: list[dict], description: str, max_workers: int):
 
     with ThreadPoolExecutor(max_workers=max_workers) as pool:
         future_to_job = {pool.submit(_download_job, job, stats): job for job in jobs}
-        results = [
-            future.result()
-            for future in tqdm(
-                as_completed(future_to_job),
-                total=len(jobs),
-                desc=description,
-                unit="file",
-            )
-        ]
+        results, ready = [], []
+        for future in tqdm(
+            as_completed(future_to_job),
+            total=len(jobs),
+            desc=description,
+            unit="file",
+        ):
+            result = future.result()
+            results.append(result)
+            if not result.startswith("FAIL"):
+                ready.append(Path(future_to_job[future]["out_path"]))
 
     failures = [r for r in results if r.startswith("FAIL")]
     log.info("=" * 70)
@@ -149,4 +161,10 @@ def execute_downloads(jobs: list[dict], description: str, max_workers: int):
         log.error("--- Download Failures ---")
         for f in failures:
             log.error(f"  - {f}")
+
+    if convert_cog:
+        from geo_tda.data_acquisition.cog import convert_to_cog
+
+        tiles = [p for p in ready if p.suffix.lower() in (".tif", ".tiff")]
+        convert_to_cog(tiles, **(cog_options or {}))
             
\ No newline at end of file
@@ -2,18 +2,34 @@
 I/O utilities for raster, vector, and provenance tracking.
 """
 
-from .provenance import write_provenance, get_git_commit
-from .raster import safe_union_all, ensure_crs, fix_invalid
+from .provenance import write_provenance, get_git_commit, provenance_path, append_processing_step
+from .raster import safe_union_all, ensure_crs, fix_invalid, TargetGrid, build_vrt, build_aligned_dem
+from .stack import CovariateStack, write_covariate_stack
+from .extract import extract_points
+from .clip import clip_provinces
 from .vector import read_vector, write_vector, detect_name_column, load_and_standardize
 
 __all__ = [
     # Provenance
     'write_provenance',
     'get_git_commit',
+    'provenance_path',
+    'append_processing_step',
     # Raster/geometry utilities
     'safe_union_all',
     'ensure_crs',
     'fix_invalid',
+    # Aligned analysis-grid DEM
+    'TargetGrid',
+    'build_vrt',
+    'build_aligned_dem',
+    # Covariate stacks
+    'CovariateStack',
+    'write_covariate_stack',
+    # Point extraction
+    'extract_points',
+    # Province clipping
+    'clip_provinces',
     # Vector I/O
     'read_vector',
     'write_vector',
@@ -0,0 +1,242 @@
+"""
+Parallel per-province clipping of a DEM mosaic under a memory budget.
+
+`notebooks/process_dems.ipynb` clips each province with one `gdal.Warp`
+call on a dask worker, so the largest province runs on a single worker while
+the others sit idle. Here every province's output window is split into
+tile jobs, and the jobs of all provinces share one thread pool whose
+concurrency is capped by a global memory budget. Each job reads one window
+of the VRT, masks the cells whose centres fall outside the province (the
+`cropToCutline` rule) and hands the block back to the main thread, which
+writes it into the province's tiled, compressed GeoTIFF. Tiles that miss
+the province entirely are written as nodata without reading the mosaic.
+
+Outputs stay on the mosaic's pixel grid (no resampling), are written to a
+temporary file and moved into place when complete, and existing outputs
+are skipped unless `overwrite` is set.
+
+Typical usage:
+    from geo_tda.geoio_utils import clip_provinces
+
+    paths = clip_provinces("study_areas.gpkg", "all_dems.vrt", "province_dems",
+                           memory_mb=8192)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import geopandas as gpd
+import numpy as np
+
+from .raster import ensure_crs
+from .vector import detect_name_column
+
+log = logging.getLogger(__name__)
+
+
+def _safe_name(name: str) -> str:
+    """File-safe province name (non-alphanumerics become underscores, as in the notebook)."""
+    return "".join(c if c.isalnum() else "_" for c in str(name))
+
+
+def _clip_tile(vrt_path: Path, window, geometry, nodata) -> np.ndarray:
+    """Read one mosaic window and set cells outside the geometry to nodata."""
+    import rasterio
+    from rasterio.features import geometry_mask
+    from rasterio.windows import transform as window_transform
+
+    with rasterio.open(vrt_path) as src:
+        data = src.read(1, window=window)
+    outside = geometry_mask(
+        [geometry], out_shape=data.shape, transform=window_transform(window, src.transform),
+    )
+    data[outside] = nodata
+    return data
+
+
+def _province_jobs(geometry, src, tile_size: int) -> Optional[dict]:
+    """Output window of a province on the mosaic grid and its tile windows."""
+    from rasterio.windows import Window, from_bounds
+    from rasterio.windows import bounds as window_bounds
+    from shapely.geometry import box
+    from shapely.prepared import prep
+
+    bounds = from_bounds(*geometry.bounds, transform=src.transform)
+    # Outermost pixels touched by the bounds: floor the start and ceil the
+    # end edge (tolerance keeps pixel-aligned bounds from gaining a cell)
+    c0 = max(0, int(np.floor(bounds.col_off + 1e-6)))
+    r0 = max(0, int(np.floor(bounds.row_off + 1e-6)))
+    c1 = min(src.width, int(np.ceil(bounds.col_off + bounds.width - 1e-6)))
+    r1 = min(src.height, int(np.ceil(bounds.row_off + bounds.height - 1e-6)))
+    if c1 <= c0 or r1 <= r0:
+        return None
+    window = Window(c0, r0, c1 - c0, r1 - r0)
+    transform = src.window_transform(window)
+    shape = prep(geometry)
+    tiles = []
+    for r in range(0, window.height, tile_size):
+        for c in range(0, window.width, tile_size):
+            local = Window(c, r, min(tile_size, window.width - c), min(tile_size, window.height - r))
+            hit = shape.intersects(box(*window_bounds(local, transform)))
+            tiles.append((local, hit))
+    return {"window": window, "transform": transform, "tiles": tiles}
+
+
+def clip_provinces(
+    provinces: Union[str, Path, gpd.GeoDataFrame],
+    vrt_path: Union[str, Path],
+    out_dir: Union[str, Path],
+    name_column: Optional[str] = None,
+    layer: Optional[str] = None,
+    tile_size: int = 4096,
+    memory_mb: int = 4096,
+    n_threads: Optional[int] = None,
+    compress: str = "LZW",
+    overwrite: bool = False,
+    progress: bool = True,
+) -> Dict[str, Path]:
+    """
+    Clip a DEM mosaic to every province, tile-parallel across all provinces.
+
+    Args:
+        provinces: Study-area GeoPackage (or any vector file) or GeoDataFrame.
+        vrt_path: Mosaic to clip (VRT or any raster).
+        out_dir: Directory for '<safe name>_dem.tif' outputs.
+        name_column: Province name column; detected when None
+            (see `detect_name_column`).
+        layer: Layer of the vector file to read.
+        tile_size: Job window edge in pixels (rounded to a multiple of 512).
+        memory_mb: Budget for blocks in flight (read buffers and blocks
+            waiting to be written); caps the number of concurrent jobs.
+        n_threads: Worker threads; defaults to the CPU count.
+        compress: GeoTIFF compression.
+        overwrite: Re-clip provinces whose output already exists.
+        progress: Show a tqdm bar over tile jobs.
+
+    Returns:
+        Mapping of province name -> output path (existing outputs included).
+    """
+    import rasterio
+    from rasterio.windows import Window
+
+    if not isinstance(provinces, gpd.GeoDataFrame):
+        provinces = gpd.read_file(provinces, layer=layer)
+    name_column = name_column or detect_name_column(provinces)
+    vrt_path = Path(vrt_path)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tile_size = max(512, tile_size // 512 * 512)
+
+    with rasterio.open(vrt_path) as src:
+        provinces = ensure_crs(provinces, src.crs)
+        dtype = src.dtypes[0]
+        nodata = src.nodata if src.nodata is not None else (-9999 if np.dtype(dtype).kind == "f" else 0)
+        base_profile = {
+            "driver": "GTiff", "dtype": dtype, "count": 1, "nodata": nodata, "crs": src.crs,
+            "tiled": True, "blockxsize": 512, "blockysize": 512,
+            "compress": compress, "BIGTIFF": "IF_SAFER",
+        }
+        outputs, plans = {}, []
+        for _, row in provinces.iterrows():
+            name = str(row[name_column])
+            out_path = out_dir / f"{_safe_name(name)}_dem.tif"
+            outputs[name] = out_path
+            if out_path.exists() and not overwrite:
+                log.info("SKIP: %s (already exists)", out_path.name)
+                continue
+            plan = _province_jobs(row.geometry, src, tile_size)
+            if plan is None:
+                log.warning("Province %s does not overlap %s", name, vrt_path.name)
+                outputs.pop(name)
+                continue
+            plan.update(name=name, geometry=row.geometry, out_path=out_path)
+            plans.append(plan)
+    if not plans:
+        log.info("All provinces already clipped")
+        return outputs
+
+    # Largest provinces first so their tiles start while the small ones fill in
+    plans.sort(key=lambda p: p["window"].width * p["window"].height, reverse=True)
+    jobs = [(plan, local, hit) for plan in plans for local, hit in plan["tiles"]]
+    job_mb = tile_size * tile_size * np.dtype(dtype).itemsize * 3 / 2**20
+    max_in_flight = max(1, int(memory_mb // job_mb))
+    n_workers = max(1, min(n_threads or os.cpu_count() or 1, max_in_flight))
+    log.info(
+        "Clipping %d provinces as %d tile jobs on %d workers (%d blocks in flight)",
+        len(plans), len(jobs), n_workers, max_in_flight,
+    )
+
+    open_files: Dict[str, rasterio.io.DatasetWriter] = {}
+    completed = False
+    remaining = {plan["name"]: len(plan["tiles"]) for plan in plans}
+
+    def write(plan, local, data) -> None:
+        name = plan["name"]
+        if name not in open_files:
+            profile = {
+                **base_profile, "height": plan["window"].height, "width": plan["window"].width,
+                "transform": plan["transform"],
+            }
+            open_files[name] = rasterio.open(plan["out_path"].with_suffix(".tif.tmp"), "w", **profile)
+        open_files[name].write(data, 1, window=local)
+        remaining[name] -= 1
+        if not remaining[name]:
+            open_files.pop(name).close()
+            os.replace(plan["out_path"].with_suffix(".tif.tmp"), plan["out_path"])
+            log.info("Wrote %s", plan["out_path"].name)
+
+    bar = None
+    if progress:
+        from tqdm.auto import tqdm
+
+        bar = tqdm(total=len(jobs), desc="Clipping provinces", unit="tile")
+    try:
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            pending = set()
+
+            def drain(return_when) -> None:
+                nonlocal pending
+                done, pending = wait(pending, return_when=return_when)
+                for future in done:
+                    plan, local = future.job
+                    write(plan, local, future.result())
+                    if bar is not None:
+                        bar.update()
+                        bar.set_postfix_str(plan["name"][:28])
+
+            for plan, local, hit in jobs:
+                if not hit:
+                    write(plan, local, np.full((local.height, local.width), nodata, dtype=dtype))
+                    if bar is not None:
+                        bar.update()
+                    continue
+                window = Window(
+                    plan["window"].col_off + local.col_off, plan["window"].row_off + local.row_off,
+                    local.width, local.height,
+                )
+                future = pool.submit(_clip_tile, vrt_path, window, plan["geometry"], nodata)
+                future.job = (plan, local)
+                pending.add(future)
+                if len(pending) >= max_in_flight:
+                    drain(FIRST_COMPLETED)
+            if pending:
+                drain(ALL_COMPLETED)
+        completed = True
+    finally:
+        for dst in open_files.values():
+            dst.close()
+        if not completed:
+            # Remove partial outputs so a rerun does not mistake them for results
+            for plan in plans:
+                plan["out_path"].with_suffix(".tif.tmp").unlink(missing_ok=True)
+        if bar is not None:
+            bar.close()
+    return outputs
+
+
+__all__ = ['clip_provinces']
@@ -35,13 +35,46 @@ def write_provenance(artifact_path: Path, source_info: dict, parameters: dict):
         "processing_parameters": parameters,
     }
 
-    # Handle both file and directory paths
+    meta_path = provenance_path(artifact_path)
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    logging.getLogger("provenance").info(f"Wrote provenance to {meta_path.name}")
+
+
+def provenance_path(artifact_path: Path) -> Path:
+    """Path of the metadata sidecar for an artifact (file or directory)."""
+    artifact_path = Path(artifact_path)
     if artifact_path.is_dir():
-        meta_path = artifact_path.parent / f"{artifact_path.name}.meta.json"
+        return artifact_path.parent / f"{artifact_path.name}.meta.json"
+    return artifact_path.with_suffix(artifact_path.suffix + ".meta.json")
+
+
+def append_processing_step(artifact_path: Path, step: dict):
+    """
+    Record a post-processing step in an artifact's metadata sidecar.
+
+    Steps are appended to the sidecar's "processing_history" list with a
+    timestamp; a minimal sidecar is created if none exists.
+
+    Args:
+        artifact_path: Path to the artifact (file or directory)
+        step: Dictionary describing the step (name, parameters, results)
+    """
+    meta_path = provenance_path(artifact_path)
+    if meta_path.exists():
+        with open(meta_path) as f:
+            meta = json.load(f)
     else:
-        meta_path = artifact_path.with_suffix(artifact_path.suffix + ".meta.json")
+        meta = {"code_version": {"git_commit": get_git_commit()}}
 
-    with open(meta_path, 'w') as f:
+    meta.setdefault("processing_history", []).append({
+        "applied_at": datetime.datetime.utcnow().isoformat() + "Z",
+        **step,
+    })
+    tmp_path = meta_path.with_suffix(".tmp")
+    with open(tmp_path, 'w') as f:
         json.dump(meta, f, indent=2)
+    tmp_path.replace(meta_path)
 
-    logging.getLogger("provenance").info(f"Wrote provenance to {meta_path.name}")
+    logging.getLogger("provenance").info(f"Recorded {step.get('step', 'processing step')} in {meta_path.name}")
@@ -6,6 +6,9 @@ Extracted from geoio.py for better organization.
 
 from __future__ import annotations
 
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Iterable, Optional, Sequence, Tuple, Union
 
@@ -84,4 +87,343 @@ def ensure_crs(
     return gdf.to_crs(target)
 
 
-__all__ = ['safe_union_all', 'ensure_crs', 'fix_invalid']
+# ---- Aligned analysis-grid DEM -----------------------------------------------
+
+_VRT_TYPES = {
+    "uint8": "Byte", "int8": "Int8", "int16": "Int16", "uint16": "UInt16",
+    "int32": "Int32", "uint32": "UInt32", "float32": "Float32", "float64": "Float64",
+}
+
+
+@dataclass(frozen=True)
+class TargetGrid:
+    """
+    Pixel grid of the analysis rasters: CRS, square cell size and snapped bounds.
+
+    Bounds are (left, bottom, right, top) multiples of `resolution`, so every
+    product built on the same CRS and resolution shares pixel edges.
+    """
+    crs: str
+    resolution: float
+    bounds: Tuple[float, float, float, float]
+
+    @classmethod
+    def from_bounds(cls, bounds: Sequence[float], crs, resolution: float) -> "TargetGrid":
+        """Grid covering `bounds` (in `crs`), snapped outward to the resolution."""
+        left, bottom, right, top = (float(b) for b in bounds)
+        res = float(resolution)
+        snapped = (
+            np.floor(left / res) * res, np.floor(bottom / res) * res,
+            np.ceil(right / res) * res, np.ceil(top / res) * res,
+        )
+        return cls(CRS.from_user_input(crs).to_string(), res, tuple(float(b) for b in snapped))
+
+    @classmethod
+    def from_aoi(cls, aoi: gpd.GeoDataFrame, crs, resolution: float) -> "TargetGrid":
+        """Grid covering an AOI's total bounds after reprojection to `crs`."""
+        return cls.from_bounds(ensure_crs(aoi, crs).total_bounds, crs, resolution)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        left, bottom, right, top = self.bounds
+        return (
+            int(round((top - bottom) / self.resolution)),
+            int(round((right - left) / self.resolution)),
+        )
+
+    @property
+    def transform(self):
+        from affine import Affine
+
+        return Affine(self.resolution, 0.0, self.bounds[0], 0.0, -self.resolution, self.bounds[3])
+
+
+def _vrt_sources(vrt_path: Path) -> set:
+    """Absolute source paths referenced by a VRT."""
+    import xml.etree.ElementTree as ET
+
+    root = ET.parse(vrt_path).getroot()
+    out = set()
+    for node in root.iter("SourceFilename"):
+        src = Path(node.text)
+        if node.get("relativeToVRT") == "1":
+            src = vrt_path.parent / src
+        out.add(str(src.resolve()))
+    return out
+
+
+def _vrt_is_current(vrt_path: Path, tiles: Sequence[Path]) -> bool:
+    """True if the VRT exists, is newer than every tile and lists exactly the tiles."""
+    if not vrt_path.exists():
+        return False
+    vrt_mtime = vrt_path.stat().st_mtime
+    if any(t.stat().st_mtime > vrt_mtime for t in tiles):
+        return False
+    try:
+        return _vrt_sources(vrt_path) == {str(t.resolve()) for t in tiles}
+    except Exception as e:
+        log.debug("Could not parse %s: %s", vrt_path, e)
+        return False
+
+
+def build_vrt(
+    tiles: Iterable[Union[str, Path]],
+    vrt_path: Union[str, Path],
+    overwrite: bool = False,
+) -> Path:
+    """
+    Mosaic VRT of single-CRS, same-resolution tiles, reused when up to date.
+
+    An existing VRT is kept when it is newer than every tile and references
+    exactly the same files. The XML is written directly (equivalent to
+    `gdalbuildvrt` for a plain mosaic), so no GDAL command-line tools are
+    needed.
+
+    Args:
+        tiles: Source rasters (band 1 is mosaicked; later tiles win overlaps).
+        vrt_path: Output .vrt path.
+        overwrite: Rebuild even when the existing VRT is current.
+
+    Returns:
+        Path to the VRT.
+    """
+    import xml.etree.ElementTree as ET
+
+    import rasterio
+
+    tiles = sorted(Path(t) for t in tiles)
+    if not tiles:
+        raise FileNotFoundError("No DEM tiles to mosaic")
+    vrt_path = Path(vrt_path)
+    if not overwrite and _vrt_is_current(vrt_path, tiles):
+        log.info("Using existing VRT (up to date): %s", vrt_path)
+        return vrt_path
+
+    metas = []
+    for tile in tiles:
+        with rasterio.open(tile) as src:
+            metas.append({
+                "path": str(tile.resolve()), "crs": src.crs, "transform": src.transform,
+                "width": src.width, "height": src.height, "dtype": src.dtypes[0],
+                "nodata": src.nodata, "block": src.block_shapes[0],
+            })
+    first = metas[0]
+    res_x, res_y = first["transform"].a, first["transform"].e
+    for meta in metas[1:]:
+        if meta["crs"] != first["crs"]:
+            raise ValueError(f"Tile {meta['path']} CRS {meta['crs']} differs from {first['crs']}")
+        if not np.allclose((meta["transform"].a, meta["transform"].e), (res_x, res_y), rtol=1e-9):
+            raise ValueError(f"Tile {meta['path']} resolution differs from {first['path']}")
+    left = min(m["transform"].c for m in metas)
+    top = max(m["transform"].f for m in metas)
+    right = max(m["transform"].c + m["width"] * res_x for m in metas)
+    bottom = min(m["transform"].f + m["height"] * res_y for m in metas)
+    width = int(round((right - left) / res_x))
+    height = int(round((bottom - top) / res_y))
+    dtype = np.result_type(*[m["dtype"] for m in metas]).name
+    nodata = next((m["nodata"] for m in metas if m["nodata"] is not None), None)
+
+    root = ET.Element("VRTDataset", rasterXSize=str(width), rasterYSize=str(height))
+    ET.SubElement(root, "SRS").text = first["crs"].to_wkt()
+    ET.SubElement(root, "GeoTransform").text = ", ".join(
+        repr(float(v)) for v in (left, res_x, 0.0, top, 0.0, res_y)
+    )
+    band = ET.SubElement(root, "VRTRasterBand", dataType=_VRT_TYPES[dtype], band="1")
+    if nodata is not None:
+        ET.SubElement(band, "NoDataValue").text = repr(float(nodata))
+    for meta in metas:
+        source = ET.SubElement(band, "ComplexSource")
+        ET.SubElement(source, "SourceFilename", relativeToVRT="0").text = meta["path"]
+        ET.SubElement(source, "SourceBand").text = "1"
+        ET.SubElement(
+            source, "SourceProperties", RasterXSize=str(meta["width"]),
+            RasterYSize=str(meta["height"]), DataType=_VRT_TYPES[meta["dtype"]],
+            BlockXSize=str(meta["block"][1]), BlockYSize=str(meta["block"][0]),
+        )
+        ET.SubElement(
+            source, "SrcRect", xOff="0", yOff="0",
+            xSize=str(meta["width"]), ySize=str(meta["height"]),
+        )
+        ET.SubElement(
+            source, "DstRect",
+            xOff=repr((meta["transform"].c - left) / res_x),
+            yOff=repr((meta["transform"].f - top) / res_y),
+            xSize=str(meta["width"]), ySize=str(meta["height"]),
+        )
+        if meta["nodata"] is not None:
+            ET.SubElement(source, "NODATA").text = repr(float(meta["nodata"]))
+
+    vrt_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = vrt_path.with_name(vrt_path.name + ".tmp")
+    ET.ElementTree(root).write(tmp_path)
+    os.replace(tmp_path, vrt_path)
+    log.info("Built VRT from %d tiles: %s (%dx%d px)", len(tiles), vrt_path, width, height)
+    return vrt_path
+
+
+def _output_is_current(out_path: Path, vrt_path: Path, grid: TargetGrid) -> bool:
+    """True if the aligned DEM exists, is newer than the VRT and lies on `grid`."""
+    import rasterio
+
+    if not out_path.exists() or out_path.stat().st_mtime < vrt_path.stat().st_mtime:
+        return False
+    with rasterio.open(out_path) as src:
+        return (
+            src.shape == grid.shape
+            and src.transform.almost_equals(grid.transform)
+            and src.crs == CRS.from_user_input(grid.crs)
+        )
+
+
+def _warp_window(
+    vrt_path: Path,
+    grid: TargetGrid,
+    window,
+    resampling,
+    nodata: float,
+    warp_mem_mb: int,
+) -> np.ndarray:
+    """Warp the VRT into one output window (each worker opens its own dataset)."""
+    import rasterio
+    from rasterio.warp import reproject
+    from rasterio.windows import transform as window_transform
+
+    out = np.full((window.height, window.width), nodata, dtype=np.float32)
+    with rasterio.open(vrt_path) as src:
+        reproject(
+            source=rasterio.band(src, 1), destination=out,
+            dst_transform=window_transform(window, grid.transform), dst_crs=grid.crs,
+            dst_nodata=nodata, resampling=resampling, num_threads=1,
+            warp_mem_limit=warp_mem_mb,
+        )
+    return out
+
+
+def build_aligned_dem(
+    tiles: Iterable[Union[str, Path]],
+    grid: TargetGrid,
+    out_path: Union[str, Path],
+    vrt_path: Optional[Union[str, Path]] = None,
+    resampling: str = "bilinear",
+    nodata: float = -9999.0,
+    tile_size: int = 2048,
+    memory_mb: int = 2048,
+    n_threads: Optional[int] = None,
+    overwrite: bool = False,
+) -> Path:
+    """
+    Build (or reuse) the aligned analysis-grid DEM from source tiles.
+
+    The tiles are mosaicked into a VRT (reused when up to date, see
+    `build_vrt`), then warped onto `grid` window by window: output windows
+    of `tile_size` pixels are reprojected in a thread pool, each worker
+    reading only the part of the VRT it needs, and written to a tiled,
+    LZW-compressed float32 GeoTIFF in the main thread. Windows outside the
+    mosaic footprint are written as nodata without warping. The output is
+    written to a temporary file and moved into place, and an existing output
+    that is newer than the VRT and already on `grid` is reused.
+
+    Args:
+        tiles: Source DEM tiles (same CRS and resolution).
+        grid: Target grid (e.g. `TargetGrid.from_aoi(aoi, "EPSG:5070", 30.0)`).
+        out_path: Output GeoTIFF.
+        vrt_path: Mosaic VRT; defaults to `<out_path stem>_mosaic.vrt` next to it.
+        resampling: rasterio resampling name.
+        nodata: Output nodata value.
+        tile_size: Output window edge in pixels (a multiple of 512).
+        memory_mb: Total budget for the GDAL block cache (a quarter of it),
+            in-flight windows and GDAL warp buffers.
+        n_threads: Worker threads; defaults to the CPU count (capped by the
+            memory budget).
+        overwrite: Rebuild even when the VRT and output are current.
+
+    Returns:
+        Path to the aligned DEM.
+    """
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.warp import transform_bounds
+    from rasterio.windows import Window
+
+    out_path = Path(out_path)
+    vrt_path = Path(vrt_path) if vrt_path else out_path.with_name(f"{out_path.stem}_mosaic.vrt")
+    vrt_path = build_vrt(tiles, vrt_path, overwrite=overwrite)
+    if not overwrite and _output_is_current(out_path, vrt_path, grid):
+        log.info("Using existing aligned DEM (up to date): %s", out_path)
+        return out_path
+
+    # Budget: the GDAL block cache, up to two float32 windows in flight per
+    # worker, and one warp buffer per worker share memory_mb
+    tile_size = max(512, tile_size // 512 * 512)
+    window_mb = tile_size * tile_size * 4 / 2**20
+    cache_mb = max(64, memory_mb // 4)
+    n_threads = n_threads or os.cpu_count() or 1
+    per_worker_mb = 2 * window_mb + max(64, window_mb)
+    n_workers = max(1, min(n_threads, int((memory_mb - cache_mb) // per_worker_mb)))
+    warp_mem_mb = max(64, int((memory_mb - cache_mb - 2 * n_workers * window_mb) / n_workers))
+    peak_mb = cache_mb + n_workers * (2 * window_mb + warp_mem_mb)
+    if peak_mb > memory_mb:
+        log.warning(
+            "memory_mb=%d is below the minimum for tile_size=%d; expect about %d MB",
+            memory_mb, tile_size, peak_mb,
+        )
+
+    height, width = grid.shape
+    windows = [
+        Window(c, r, min(tile_size, width - c), min(tile_size, height - r))
+        for r in range(0, height, tile_size) for c in range(0, width, tile_size)
+    ]
+    with rasterio.open(vrt_path) as src:
+        footprint = transform_bounds(src.crs, grid.crs, *src.bounds, densify_pts=21)
+    log.info(
+        "Warping %s -> %s: %dx%d px on %s @ %g, %d windows, %d workers",
+        vrt_path.name, out_path.name, height, width, grid.crs, grid.resolution,
+        len(windows), n_workers,
+    )
+
+    profile = {
+        "driver": "GTiff", "dtype": "float32", "count": 1, "nodata": nodata,
+        "height": height, "width": width, "crs": grid.crs, "transform": grid.transform,
+        "tiled": True, "blockxsize": 512, "blockysize": 512,
+        "compress": "LZW", "predictor": 3, "BIGTIFF": "IF_SAFER",
+    }
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+
+    def overlaps(window) -> bool:
+        left, bottom, right, top = rasterio.windows.bounds(window, grid.transform)
+        return not (
+            right <= footprint[0] or left >= footprint[2]
+            or top <= footprint[1] or bottom >= footprint[3]
+        )
+
+    method = Resampling[resampling]
+    with (
+        rasterio.Env(GDAL_CACHEMAX=cache_mb),
+        rasterio.open(tmp_path, "w", **profile) as dst,
+        ThreadPoolExecutor(max_workers=n_workers) as pool,
+    ):
+        pending = set()
+        for window in windows:
+            if not overlaps(window):
+                dst.write(np.full((window.height, window.width), nodata, dtype=np.float32), 1, window=window)
+                continue
+            future = pool.submit(_warp_window, vrt_path, grid, window, method, nodata, warp_mem_mb)
+            future.window = window
+            pending.add(future)
+            # Keep at most one extra window per worker in memory
+            if len(pending) >= 2 * n_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    dst.write(f.result(), 1, window=f.window)
+        for f in as_completed(pending):
+            dst.write(f.result(), 1, window=f.window)
+    os.replace(tmp_path, out_path)
+    log.info("Wrote aligned DEM %s", out_path)
+    return out_path
+
+
+__all__ = [
+    'safe_union_all', 'ensure_crs', 'fix_invalid',
+    'TargetGrid', 'build_vrt', 'build_aligned_dem',
+]
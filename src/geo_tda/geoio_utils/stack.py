@@ -0,0 +1,434 @@
+"""
+Single-store covariate stack on the aligned analysis grid.
+
+The covariate notebook writes every layer to its own GeoTIFF (slope, each
+relief window, each roughness level, TWI, ...), so later stages reopen and
+read dozens of files for every sample. A `CovariateStack` keeps all layers
+in one chunked Zarr array:
+
+    <stack>.zarr/
+        zarr.json      attrs: manifest (layers + provenance), CRS, transform
+        covariates     float32 (layer, y, x), NaN = nodata
+        y, x           float64 pixel-centre coordinates
+
+Chunks span `layer_chunk` layers, so the values of every covariate at a
+pixel (or a window of pixels) come from one chunk read. New layers are
+appended in place by growing the layer axis; the manifest records the name,
+source and attributes of each layer in order.
+
+`to_cog` exports the stack as one pixel-interleaved multiband COG with band
+descriptions and the manifest in the GeoTIFF tags.
+
+Typical usage:
+    stack = write_covariate_stack(
+        {"slope_deg": "slope.tif", "twi": "twi.tif"}, "covariates.zarr",
+        template="dem_aligned.tif",
+    )
+    stack.append(terrain_derivatives("dem_aligned.tif", ["tpi_3", "relief_15"]))
+    values = stack.read(rows=slice(0, 512), cols=slice(0, 512))
+"""
+
+from __future__ import annotations
+
+import datetime
+import json
+import logging
+import tempfile
+from pathlib import Path
+from typing import List, Mapping, Optional, Sequence, Union
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+_ARRAY = "covariates"
+
+
+def _open_layer(source, chunk_size: int):
+    """Open a raster path or DataArray as a (band, y, x) DataArray."""
+    import xarray as xr
+
+    if isinstance(source, (str, Path)):
+        import rioxarray as rxr
+
+        source = rxr.open_rasterio(source, masked=True, chunks={"x": chunk_size, "y": chunk_size})
+    if not isinstance(source, xr.DataArray):
+        raise TypeError(f"Expected a raster path or xarray.DataArray, got {type(source).__name__}")
+    if source.ndim == 2:
+        source = source.expand_dims("band")
+    if source.ndim != 3 or source.dims[1:] != ("y", "x"):
+        raise ValueError(f"Expected a ('y', 'x') or (band, 'y', 'x') raster, got dims {source.dims}")
+    return source
+
+
+def _band_names(da, name: str) -> List[str]:
+    """Layer names of a (band, y, x) DataArray: the key for one band, else band names."""
+    n = da.shape[0]
+    if n == 1:
+        return [name]
+    band = da.coords.get(da.dims[0])
+    if band is not None and band.dtype.kind in "OUS":
+        return [str(b) for b in band.values]
+    long_name = da.attrs.get("long_name")
+    if isinstance(long_name, (tuple, list)) and len(long_name) == n:
+        return [str(b) for b in long_name]
+    return [f"{name}_{i + 1}" for i in range(n)]
+
+
+def _grid(da) -> dict:
+    """CRS and transform of a DataArray (when rioxarray knows them)."""
+    try:
+        import rioxarray  # noqa: F401  (registers the .rio accessor)
+        crs = da.rio.crs
+        transform = list(da.rio.transform())[:6]
+    except ImportError:
+        crs, transform = None, None
+    return {"crs_wkt": crs.to_wkt() if crs is not None else None, "transform": transform}
+
+
+class CovariateStack:
+    """
+    Zarr-backed stack of covariate layers sharing one grid.
+
+    Open an existing stack with `CovariateStack(path)`; create one with
+    `CovariateStack.create` or `write_covariate_stack`.
+    """
+
+    def __init__(self, path: Union[str, Path], mode: str = "r"):
+        import zarr
+
+        self.path = Path(path)
+        self.root = zarr.open_group(str(self.path), mode=mode)
+        self.array = self.root[_ARRAY]
+        self.shape = tuple(self.array.shape[1:])
+
+    @classmethod
+    def create(
+        cls,
+        path: Union[str, Path],
+        template,
+        chunk_size: int = 512,
+        layer_chunk: int = 16,
+        attrs: Optional[dict] = None,
+        overwrite: bool = False,
+    ) -> "CovariateStack":
+        """
+        Create an empty stack on the grid of a template raster.
+
+        Args:
+            path: Zarr directory to create.
+            template: Raster path or DataArray defining the grid (usually the
+                aligned DEM).
+            chunk_size: Spatial chunk edge in pixels.
+            layer_chunk: Layers per chunk; per-pixel reads of up to this many
+                layers touch one chunk.
+            attrs: Extra JSON-serialisable provenance for the manifest.
+            overwrite: Replace an existing store at `path`.
+        """
+        import zarr
+
+        path = Path(path)
+        if path.exists() and not overwrite:
+            raise FileExistsError(f"Covariate stack already exists: {path}")
+        grid = _open_layer(template, chunk_size)
+        ny, nx = grid.shape[1:]
+        root = zarr.open_group(str(path), mode="w")
+        root.attrs.update({
+            **_grid(grid),
+            "manifest": {
+                "created_utc": datetime.datetime.utcnow().isoformat() + "Z",
+                "provenance": attrs or {},
+                "layers": [],
+            },
+        })
+        root.create_array(
+            _ARRAY, shape=(0, ny, nx), dtype=np.float32, fill_value=np.nan,
+            chunks=(layer_chunk, min(chunk_size, ny), min(chunk_size, nx)),
+            dimension_names=("layer", "y", "x"),
+        )
+        for dim in ("y", "x"):
+            values = np.asarray(grid[dim], dtype=np.float64)
+            root.create_array(
+                dim, shape=values.shape, dtype=np.float64, chunks=values.shape,
+                dimension_names=(dim,),
+            )[:] = values
+        return cls(path, mode="r+")
+
+    # ---- Manifest ------------------------------------------------------------
+
+    @property
+    def manifest(self) -> dict:
+        """Creation time, provenance and the ordered layer records."""
+        return dict(self.root.attrs["manifest"])
+
+    @property
+    def layers(self) -> List[str]:
+        """Layer names in stack order."""
+        return [layer["name"] for layer in self.manifest["layers"]]
+
+    @property
+    def cellsize(self) -> float:
+        """Pixel size from the x coordinates."""
+        x = self.root["x"][:]
+        return float(abs(x[1] - x[0])) if x.size > 1 else 1.0
+
+    def _indices(self, layers: Optional[Sequence[str]]) -> List[int]:
+        names = self.layers
+        if layers is None:
+            return list(range(len(names)))
+        missing = [name for name in layers if name not in names]
+        if missing:
+            raise KeyError(f"Layers not in the stack: {missing}")
+        return [names.index(name) for name in layers]
+
+    # ---- Writing -------------------------------------------------------------
+
+    def _check_grid(self, da, name: str) -> None:
+        if tuple(da.shape[1:]) != self.shape:
+            raise ValueError(f"Layer {name!r} has shape {da.shape[1:]}, stack grid is {self.shape}")
+        for dim in ("y", "x"):
+            if dim in da.coords and not np.allclose(
+                np.asarray(da[dim]), self.root[dim][:], rtol=0, atol=1e-6 * abs(self.cellsize),
+            ):
+                raise ValueError(f"Layer {name!r} is not on the stack grid ({dim} coordinates differ)")
+        crs = _grid(da)["crs_wkt"]
+        stack_crs = self.root.attrs.get("crs_wkt")
+        if crs and stack_crs:
+            from pyproj import CRS
+
+            if CRS.from_wkt(crs) != CRS.from_wkt(stack_crs):
+                raise ValueError(f"Layer {name!r} CRS differs from the stack CRS")
+
+    def append(
+        self,
+        layers,
+        attrs: Optional[Mapping[str, dict]] = None,
+        overwrite: bool = False,
+        scheduler: Optional[str] = None,
+    ) -> List[str]:
+        """
+        Append layers to the stack in one chunked pass.
+
+        Args:
+            layers: Mapping of name -> raster path or DataArray, or a single
+                (band, y, x) DataArray such as a `terrain_derivatives` stack.
+                Multiband sources add one layer per band, named by the band
+                coordinate or band descriptions.
+            attrs: Optional per-layer attributes for the manifest, by name.
+            overwrite: Rewrite layers that already exist (in place) instead of
+                raising.
+            scheduler: Dask scheduler name; None uses the active default.
+
+        Returns:
+            The names written, in stack order.
+        """
+        import dask.array as da
+
+        if not isinstance(layers, Mapping):
+            layers = {getattr(layers, "name", None) or "layer": layers}
+        chunks = self.array.chunks[1:]
+        names, arrays, records = [], [], []
+        for key, source in layers.items():
+            grid = _open_layer(source, chunks[0])
+            self._check_grid(grid, key)
+            band_names = _band_names(grid, key)
+            data = grid.data if isinstance(grid.data, da.Array) else da.from_array(grid.data)
+            for i, name in enumerate(band_names):
+                names.append(name)
+                arrays.append(data[i])
+                records.append({
+                    "name": name,
+                    "source": str(source) if isinstance(source, (str, Path)) else None,
+                    **((attrs or {}).get(name, {})),
+                })
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate layer names in {names}")
+        existing = self.layers
+        clash = [name for name in names if name in existing]
+        if clash and not overwrite:
+            raise ValueError(f"Layers already in the stack: {clash} (pass overwrite=True)")
+
+        # New layers go to the end; existing ones are rewritten in place
+        manifest = self.manifest
+        slots = []
+        for name, record in zip(names, records):
+            if name in existing:
+                k = existing.index(name)
+                manifest["layers"][k] = record
+            else:
+                k = len(manifest["layers"])
+                manifest["layers"].append(record)
+            slots.append(k)
+        n_layers = len(manifest["layers"])
+        if n_layers > self.array.shape[0]:
+            self.array.resize((n_layers,) + self.shape)
+
+        # Runs of consecutive slots are stored as one (k, y, x) block per chunk
+        start = 0
+        while start < len(slots):
+            stop = start + 1
+            while stop < len(slots) and slots[stop] == slots[stop - 1] + 1:
+                stop += 1
+            block = da.stack(arrays[start:stop]).astype(np.float32).rechunk((stop - start,) + chunks)
+            region = (slice(slots[start], slots[stop - 1] + 1), slice(None), slice(None))
+            da.store(block, self.array, regions=region, lock=False, scheduler=scheduler)
+            start = stop
+        self.root.attrs["manifest"] = manifest
+        log.info("Stored %d layers in %s (%d total)", len(names), self.path, n_layers)
+        return names
+
+    # ---- Reading -------------------------------------------------------------
+
+    def read(
+        self,
+        layers: Optional[Sequence[str]] = None,
+        rows: Optional[slice] = None,
+        cols: Optional[slice] = None,
+    ) -> np.ndarray:
+        """(n_layers, h, w) float32 values of a pixel window; None reads everything."""
+        idx = self._indices(layers)
+        window = self.array.oindex[idx, rows or slice(None), cols or slice(None)]
+        return np.asarray(window)
+
+    def pixel_values(
+        self,
+        rows: np.ndarray,
+        cols: np.ndarray,
+        layers: Optional[Sequence[str]] = None,
+    ) -> np.ndarray:
+        """(n_points, n_layers) values at integer pixel indices."""
+        idx = np.asarray(self._indices(layers))
+        rows = np.asarray(rows, dtype=np.intp).ravel()
+        cols = np.asarray(cols, dtype=np.intp).ravel()
+        if not idx.size or not rows.size:
+            return np.empty((rows.size, idx.size), dtype=np.float32)
+        selection = (
+            np.repeat(idx, rows.size), np.tile(rows, idx.size), np.tile(cols, idx.size),
+        )
+        values = self.array.get_coordinate_selection(selection)
+        return values.reshape(idx.size, rows.size).T
+
+    def to_dataarray(self, layers: Optional[Sequence[str]] = None):
+        """Lazy ('layer', 'y', 'x') DataArray over the store, with the CRS attached."""
+        import dask.array as da
+        import xarray as xr
+
+        idx = self._indices(layers)
+        data = da.from_zarr(self.array)[idx]
+        out = xr.DataArray(
+            data, dims=("layer", "y", "x"),
+            coords={
+                "layer": [self.layers[k] for k in idx],
+                "y": self.root["y"][:], "x": self.root["x"][:],
+            },
+            name="covariates",
+        )
+        crs_wkt = self.root.attrs.get("crs_wkt")
+        if crs_wkt:
+            import rioxarray  # noqa: F401  (registers the .rio accessor)
+
+            out = out.rio.write_crs(crs_wkt).rio.write_nodata(np.nan, encoded=False)
+        return out
+
+    # ---- Export --------------------------------------------------------------
+
+    def to_cog(
+        self,
+        out_path: Union[str, Path],
+        layers: Optional[Sequence[str]] = None,
+        blocksize: int = 512,
+        compress: str = "DEFLATE",
+    ) -> Path:
+        """
+        Export layers as one pixel-interleaved multiband Cloud Optimized GeoTIFF.
+
+        Bands carry the layer names as descriptions and the manifest is stored
+        in the 'COVARIATE_MANIFEST' tag. The stack is copied in 2D windows of
+        whole chunks through a temporary tiled GeoTIFF.
+        """
+        import rasterio
+        from affine import Affine
+        from rasterio.shutil import copy as rio_copy
+
+        idx = self._indices(layers)
+        names = [self.layers[k] for k in idx]
+        out_path = Path(out_path)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        transform = self.root.attrs.get("transform")
+        crs_wkt = self.root.attrs.get("crs_wkt")
+        profile = {
+            "driver": "GTiff", "dtype": "float32", "count": len(idx), "nodata": np.nan,
+            "height": self.shape[0], "width": self.shape[1], "tiled": True,
+            "blockxsize": blocksize, "blockysize": blocksize, "interleave": "pixel",
+            "crs": crs_wkt, "transform": Affine(*transform) if transform else None,
+            "BIGTIFF": "IF_SAFER",
+        }
+        # Square windows of whole chunks keep memory at a few chunks per layer
+        row_step = max(blocksize, self.array.chunks[1])
+        col_step = max(blocksize, self.array.chunks[2])
+        with tempfile.TemporaryDirectory(dir=out_path.parent) as tmp:
+            tmp_path = Path(tmp) / "stack.tif"
+            with rasterio.open(tmp_path, "w", **profile) as dst:
+                for r0 in range(0, self.shape[0], row_step):
+                    r1 = min(r0 + row_step, self.shape[0])
+                    for c0 in range(0, self.shape[1], col_step):
+                        c1 = min(c0 + col_step, self.shape[1])
+                        values = self.read(names, rows=slice(r0, r1), cols=slice(c0, c1))
+                        dst.write(values, window=((r0, r1), (c0, c1)))
+                for band, name in enumerate(names, start=1):
+                    dst.set_band_description(band, name)
+                dst.update_tags(COVARIATE_MANIFEST=json.dumps(self.manifest))
+            rio_copy(
+                tmp_path, out_path, driver="COG", BLOCKSIZE=blocksize,
+                COMPRESS=compress, BIGTIFF="IF_SAFER",
+            )
+        log.info("Wrote %d-band COG %s", len(idx), out_path)
+        return out_path
+
+
+def write_covariate_stack(
+    layers,
+    path: Union[str, Path],
+    template=None,
+    chunk_size: int = 512,
+    layer_chunk: int = 16,
+    attrs: Optional[dict] = None,
+    append: bool = True,
+    overwrite: bool = False,
+    scheduler: Optional[str] = None,
+) -> CovariateStack:
+    """
+    Write covariate layers into one Zarr stack, creating it if needed.
+
+    Args:
+        layers: Mapping of name -> raster path or DataArray, or one (band, y, x)
+            DataArray (see `CovariateStack.append`).
+        path: Zarr directory of the stack.
+        template: Grid template for a new stack; defaults to the first layer.
+        chunk_size: Spatial chunk edge for a new stack.
+        layer_chunk: Layers per chunk for a new stack.
+        attrs: Provenance recorded in the manifest of a new stack.
+        append: Add to an existing stack at `path` (otherwise it must not exist,
+            or is replaced with `overwrite`).
+        overwrite: With `append`, rewrite layers that already exist; without
+            it, replace the whole store.
+        scheduler: Dask scheduler name; None uses the active default.
+
+    Returns:
+        The CovariateStack.
+    """
+    path = Path(path)
+    if append and path.exists():
+        stack = CovariateStack(path, mode="r+")
+    else:
+        if template is None:
+            template = next(iter(layers.values())) if isinstance(layers, Mapping) else layers
+        stack = CovariateStack.create(
+            path, template, chunk_size=chunk_size, layer_chunk=layer_chunk,
+            attrs=attrs, overwrite=overwrite,
+        )
+    stack.append(layers, overwrite=overwrite and append, scheduler=scheduler)
+    return stack
+
+
+__all__ = ['CovariateStack', 'write_covariate_stack']
@@ -0,0 +1,14 @@
+"""
+Hydrological conditioning and flow-derived terrain covariates.
+"""
+
+from .fill import fill_depressions
+from .flow import flow_accumulation, wetness_indices
+
+__all__ = [
+    # Depression filling
+    'fill_depressions',
+    # Flow routing
+    'flow_accumulation',
+    'wetness_indices',
+]
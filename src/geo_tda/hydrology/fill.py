@@ -0,0 +1,420 @@
+"""
+Tiled priority-flood depression filling.
+
+Replaces the WhiteboxTools sink-filling step of Protocol 6.1 with an
+in-process implementation that never holds the whole mosaic in memory. It
+follows the three-stage tiled scheme of Barnes (2016, "Parallel
+priority-flood depression filling for trillion cell digital elevation
+models"):
+
+1. Every tile is flooded independently. Its perimeter cells seed the flood,
+   each with its own label, and nodata cells seed a shared "outside" label
+   that drains everything next to it. Cells inherit the label of the seed
+   that reaches them, and wherever two labels meet the spill elevation
+   between them is recorded.
+2. The labels of all tiles form a small graph whose edges are those spill
+   elevations plus the 8-neighbour contacts across tile seams (and edges to
+   the outside along the raster border). A priority flood on this graph
+   from the outside gives every label the level its water must rise to.
+3. Each tile is raised to the level of its labels, which equals a
+   whole-raster fill exactly.
+
+Flat areas produced by filling are flooded with a plain FIFO queue instead
+of the priority queue (Barnes et al., 2014). With `epsilon=True` the last
+stage re-floods each tile from its resolved perimeter and raises filled
+cells by the smallest float32 increment instead, so every filled cell has a
+strictly descending path to a tile edge; flats that straddle a tile seam are
+graded towards the seam within each tile.
+
+Kernels are compiled with Numba when it is installed (see
+`geo_tda.utils.jit`).
+
+Typical usage:
+    from geo_tda.hydrology import fill_depressions
+
+    fill_depressions("dem_aligned.tif", "dem_filled.tif", tile_size=4096)
+"""
+
+from __future__ import annotations
+
+import logging
+import tempfile
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+from geo_tda.tda.merge_tree import _NEIGHBORS_8, _open_source, _output_profile
+from geo_tda.utils.jit import njit
+
+log = logging.getLogger(__name__)
+
+OUTSIDE = 0
+
+
+# ---- Kernels -----------------------------------------------------------------
+
+
+@njit(cache=True)
+def _heap_push(keys: np.ndarray, vals: np.ndarray, size: int, key: float, val: int) -> int:
+    """Push onto an array-backed binary min-heap ordered by (key, val)."""
+    i = size
+    keys[i] = key
+    vals[i] = val
+    while i > 0:
+        up = (i - 1) >> 1
+        if keys[up] < keys[i] or (keys[up] == keys[i] and vals[up] <= vals[i]):
+            break
+        keys[up], keys[i] = keys[i], keys[up]
+        vals[up], vals[i] = vals[i], vals[up]
+        i = up
+    return size + 1
+
+
+@njit(cache=True)
+def _heap_pop(keys: np.ndarray, vals: np.ndarray, size: int) -> Tuple[int, int]:
+    """Pop the minimum; returns (val, new size)."""
+    top = vals[0]
+    size -= 1
+    keys[0] = keys[size]
+    vals[0] = vals[size]
+    i = 0
+    while True:
+        lo = i
+        for child in (2 * i + 1, 2 * i + 2):
+            if child < size and (
+                keys[child] < keys[lo] or (keys[child] == keys[lo] and vals[child] < vals[lo])
+            ):
+                lo = child
+        if lo == i:
+            break
+        keys[lo], keys[i] = keys[i], keys[lo]
+        vals[lo], vals[i] = vals[i], vals[lo]
+        i = lo
+    return top, size
+
+
+@njit(cache=True)
+def _priority_flood(
+    z: np.ndarray,
+    ncols: int,
+    seeds: np.ndarray,
+    seed_values: np.ndarray,
+    seed_labels: np.ndarray,
+    neighbors: np.ndarray,
+    epsilon: bool,
+    record: bool,
+):
+    """
+    Priority-flood one tile from the given seeds.
+
+    Returns (filled, label, edge_a, edge_b, edge_h, n_edges): filled float32
+    elevations, the seed label each cell inherited, and (when `record`) the
+    spill elevations where two labels meet.
+    """
+    n = z.shape[0]
+    nrows = n // ncols
+    filled = z.copy()
+    label = np.full(n, -1, dtype=np.int64)
+    keys = np.empty(n, dtype=np.float64)
+    vals = np.empty(n, dtype=np.int64)
+    size = 0
+    pit = np.empty(n, dtype=np.int64)
+    head = 0
+    tail = 0
+    cap = max(1024, n // 16) if record else 1
+    edge_a = np.empty(cap, dtype=np.int64)
+    edge_b = np.empty(cap, dtype=np.int64)
+    edge_h = np.empty(cap, dtype=np.float32)
+    n_edges = 0
+    up_inf = np.float32(np.inf)
+
+    for s in range(seeds.shape[0]):
+        p = seeds[s]
+        filled[p] = seed_values[s]
+        label[p] = seed_labels[s]
+        size = _heap_push(keys, vals, size, filled[p], p)
+
+    while size > 0 or head < tail:
+        if head < tail and not (epsilon and size > 0 and keys[0] == filled[pit[head]]):
+            c = pit[head]
+            head += 1
+        else:
+            c, size = _heap_pop(keys, vals, size)
+        fc = filled[c]
+        step = np.nextafter(fc, up_inf) if epsilon else fc
+        r = c // ncols
+        col = c - r * ncols
+        for m in range(neighbors.shape[0]):
+            rr = r + neighbors[m, 0]
+            cc = col + neighbors[m, 1]
+            if rr < 0 or rr >= nrows or cc < 0 or cc >= ncols:
+                continue
+            q = rr * ncols + cc
+            if label[q] != -1:
+                if record and label[q] != label[c]:
+                    if n_edges == edge_a.shape[0]:
+                        edge_a = np.concatenate((edge_a, np.empty_like(edge_a)))
+                        edge_b = np.concatenate((edge_b, np.empty_like(edge_b)))
+                        edge_h = np.concatenate((edge_h, np.empty_like(edge_h)))
+                    edge_a[n_edges] = label[c]
+                    edge_b[n_edges] = label[q]
+                    edge_h[n_edges] = max(fc, filled[q])
+                    n_edges += 1
+                continue
+            label[q] = label[c]
+            if z[q] <= step:
+                filled[q] = step
+                pit[tail] = q
+                tail += 1
+            else:
+                size = _heap_push(keys, vals, size, z[q], q)
+    return filled, label, edge_a, edge_b, edge_h, n_edges
+
+
+@njit(cache=True)
+def _spill_levels(indptr: np.ndarray, nbr: np.ndarray, h: np.ndarray, n_nodes: int) -> np.ndarray:
+    """Minimax spill level of every label from OUTSIDE (priority flood on the graph)."""
+    level = np.full(n_nodes, np.inf)
+    done = np.zeros(n_nodes, dtype=np.bool_)
+    keys = np.empty(nbr.shape[0] + 1, dtype=np.float64)
+    vals = np.empty(nbr.shape[0] + 1, dtype=np.int64)
+    level[OUTSIDE] = -np.inf
+    size = _heap_push(keys, vals, 0, -np.inf, OUTSIDE)
+    while size > 0:
+        u, size = _heap_pop(keys, vals, size)
+        if done[u]:
+            continue
+        done[u] = True
+        for k in range(indptr[u], indptr[u + 1]):
+            v = nbr[k]
+            lv = max(level[u], h[k])
+            if lv < level[v]:
+                level[v] = lv
+                size = _heap_push(keys, vals, size, lv, v)
+    return level
+
+
+# ---- Tile helpers ------------------------------------------------------------
+
+
+def _tile_bounds(nrows: int, ncols: int, tile_size: int):
+    for r0 in range(0, nrows, tile_size):
+        for c0 in range(0, ncols, tile_size):
+            yield r0, min(r0 + tile_size, nrows), c0, min(c0 + tile_size, ncols)
+
+
+def _perimeter(shape: Tuple[int, int]) -> np.ndarray:
+    """Flat indices of a block's edge cells, each once."""
+    edge = np.zeros(shape, dtype=bool)
+    edge[0, :] = edge[-1, :] = edge[:, 0] = edge[:, -1] = True
+    return np.flatnonzero(edge)
+
+
+def _tile_seeds(z: np.ndarray, perimeter_values: np.ndarray, first_label: int):
+    """Seeds for one tile: nodata drains to OUTSIDE, valid perimeter cells get labels."""
+    nodata = np.flatnonzero(np.isnan(z))
+    edge = _perimeter(z.shape)
+    edge = edge[~np.isnan(z.ravel()[edge])]
+    edge_values = perimeter_values[edge]
+    seeds = np.concatenate((nodata, edge))
+    values = np.concatenate((np.full(nodata.size, -np.inf), edge_values)).astype(np.float32)
+    labels = np.concatenate((
+        np.full(nodata.size, OUTSIDE, dtype=np.int64),
+        first_label + np.arange(edge.size, dtype=np.int64),
+    ))
+    return seeds, values, labels
+
+
+def _min_edges(a: np.ndarray, b: np.ndarray, h: np.ndarray):
+    """Undirected edge list reduced to the lowest spill per label pair."""
+    lo, hi = np.minimum(a, b), np.maximum(a, b)
+    keep = lo != hi
+    lo, hi, h = lo[keep], hi[keep], h[keep]
+    if lo.size == 0:
+        return lo, hi, h
+    order = np.lexsort((h, hi, lo))
+    lo, hi, h = lo[order], hi[order], h[order]
+    first = np.ones(lo.size, dtype=bool)
+    first[1:] = (lo[1:] != lo[:-1]) | (hi[1:] != hi[:-1])
+    return lo[first], hi[first], h[first]
+
+
+def _seam_edges(label_a, fill_a, label_b, fill_b):
+    """8-neighbour contacts between two adjacent lines of cells."""
+    n = label_a.size
+    us, vs, hs = [], [], []
+    for d in (-1, 0, 1):
+        i = np.arange(max(0, -d), min(n, n - d))
+        j = i + d
+        us.append(label_a[i])
+        vs.append(label_b[j])
+        hs.append(np.maximum(fill_a[i], fill_b[j]))
+    return np.concatenate(us), np.concatenate(vs), np.concatenate(hs)
+
+
+# ---- Engine ------------------------------------------------------------------
+
+
+def fill_depressions(
+    dem,
+    out_path: Optional[Union[str, Path]] = None,
+    tile_size: int = 2048,
+    epsilon: bool = False,
+    nodata: Optional[float] = None,
+    tmp_dir: Optional[Union[str, Path]] = None,
+) -> Union[np.ndarray, Path]:
+    """
+    Fill all depressions of a DEM so that every cell drains to an edge.
+
+    Cells on the raster border and cells next to nodata are outlets. The
+    result is the lowest surface at or above the DEM without interior pits,
+    identical to a whole-raster priority flood for any `tile_size`.
+
+    Args:
+        dem: DEM path (band 1, nodata masked) or 2D array.
+        out_path: Optional GeoTIFF path; requires a path DEM for georeferencing.
+        tile_size: Tile edge in pixels; bounds the memory of the local passes.
+        epsilon: Grade filled flats upwards by one float32 ulp per cell so that
+            flow routing finds a descending path (Priority-Flood+epsilon).
+        nodata: Nodata value for array input (NaN is always treated as nodata).
+        tmp_dir: Directory for the on-disk per-pixel caches.
+
+    Returns:
+        float32 filled DEM (NaN at nodata), or `out_path` when given.
+    """
+    source = _open_source(dem, nodata)
+    if out_path is not None and source.profile is None:
+        source.close()
+        raise ValueError("Writing a raster requires a georeferenced DEM path as input")
+    nrows, ncols = source.shape
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir, prefix="fill_") as tmp:
+        try:
+            label_cache = np.lib.format.open_memmap(
+                Path(tmp) / "label.npy", mode="w+", dtype=np.int64, shape=(nrows, ncols),
+            )
+            fill_cache = np.lib.format.open_memmap(
+                Path(tmp) / "fill.npy", mode="w+", dtype=np.float32, shape=(nrows, ncols),
+            )
+            level = _resolve_levels(source, label_cache, fill_cache, tile_size)
+            result = _write_filled(
+                source, label_cache, fill_cache, level, tile_size, epsilon, out_path,
+            )
+            del label_cache, fill_cache
+        finally:
+            source.close()
+    return result
+
+
+def _resolve_levels(source, label_cache, fill_cache, tile_size: int) -> np.ndarray:
+    """Stages 1 and 2: flood every tile, then resolve label levels globally."""
+    nrows, ncols = source.shape
+    us, vs, hs = [], [], []
+    next_label = OUTSIDE + 1
+    n_tiles = 0
+
+    for r0, r1, c0, c1 in _tile_bounds(nrows, ncols, tile_size):
+        z = source.read_window(r0, r1, c0, c1).astype(np.float32)
+        flat = z.ravel()
+        seeds, values, labels = _tile_seeds(z, flat, next_label)
+        filled, label, ea, eb, eh, n_edges = _priority_flood(
+            flat, c1 - c0, seeds, values, labels, _NEIGHBORS_8, False, True,
+        )
+        u, v, h = _min_edges(ea[:n_edges], eb[:n_edges], eh[:n_edges])
+        us.append(u)
+        vs.append(v)
+        hs.append(h)
+        label_cache[r0:r1, c0:c1] = label.reshape(z.shape)
+        fill_cache[r0:r1, c0:c1] = filled.reshape(z.shape)
+        next_label += int(labels.size - np.count_nonzero(labels == OUTSIDE))
+        n_tiles += 1
+
+    # Raster border cells drain to the outside at their own elevation
+    for lab, fil in (
+        (label_cache[0], fill_cache[0]), (label_cache[-1], fill_cache[-1]),
+        (label_cache[:, 0], fill_cache[:, 0]), (label_cache[:, -1], fill_cache[:, -1]),
+    ):
+        lab, fil = np.asarray(lab), np.asarray(fil)
+        us.append(lab)
+        vs.append(np.full(lab.size, OUTSIDE, dtype=np.int64))
+        hs.append(fil)
+
+    # Contacts across tile seams
+    for r in range(tile_size, nrows, tile_size):
+        u, v, h = _seam_edges(label_cache[r - 1], fill_cache[r - 1], label_cache[r], fill_cache[r])
+        us.append(u)
+        vs.append(v)
+        hs.append(h)
+    for c in range(tile_size, ncols, tile_size):
+        u, v, h = _seam_edges(
+            np.asarray(label_cache[:, c - 1]), np.asarray(fill_cache[:, c - 1]),
+            np.asarray(label_cache[:, c]), np.asarray(fill_cache[:, c]),
+        )
+        us.append(u)
+        vs.append(v)
+        hs.append(h)
+
+    u, v, h = _min_edges(np.concatenate(us), np.concatenate(vs), np.concatenate(hs))
+    src = np.concatenate((u, v))
+    dst = np.concatenate((v, u))
+    hh = np.concatenate((h, h)).astype(np.float64)
+    order = np.argsort(src, kind="stable")
+    indptr = np.zeros(next_label + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=next_label), out=indptr[1:])
+    level = _spill_levels(indptr, dst[order], hh[order], next_label)
+    log.info(
+        "Depression filling: %d tiles, %d labels, %d spill edges", n_tiles, next_label, u.size,
+    )
+    return level
+
+
+def _write_filled(
+    source,
+    label_cache,
+    fill_cache,
+    level: np.ndarray,
+    tile_size: int,
+    epsilon: bool,
+    out_path: Optional[Union[str, Path]],
+) -> Union[np.ndarray, Path]:
+    """Stage 3: raise every tile to its labels' levels and emit it."""
+    nrows, ncols = source.shape
+    dst = None
+    out = None
+    if out_path is not None:
+        import rasterio
+        from rasterio.windows import Window
+
+        out_path = Path(out_path)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        dst = rasterio.open(out_path, "w", **_output_profile(source.profile))
+    else:
+        out = np.full((nrows, ncols), np.nan, dtype=np.float32)
+
+    try:
+        for r0, r1, c0, c1 in _tile_bounds(nrows, ncols, tile_size):
+            label = np.asarray(label_cache[r0:r1, c0:c1])
+            filled = np.maximum(
+                np.asarray(fill_cache[r0:r1, c0:c1]), level[label].astype(np.float32),
+            )
+            if epsilon:
+                z = source.read_window(r0, r1, c0, c1).astype(np.float32)
+                seeds, values, labels = _tile_seeds(z, filled.ravel(), OUTSIDE + 1)
+                filled, _, _, _, _, _ = _priority_flood(
+                    z.ravel(), c1 - c0, seeds, values, labels, _NEIGHBORS_8, True, False,
+                )
+                filled = filled.reshape(z.shape)
+            filled[np.isneginf(filled)] = np.nan
+            if dst is not None:
+                dst.write(filled, 1, window=Window(c0, r0, c1 - c0, r1 - r0))
+            else:
+                out[r0:r1, c0:c1] = filled
+    finally:
+        if dst is not None:
+            dst.close()
+            log.info("Wrote %s", out_path)
+    return out_path if dst is not None else out
+
+
+__all__ = ['fill_depressions']
@@ -0,0 +1,502 @@
+"""
+Tiled D8 / D-infinity flow accumulation and the TWI / SPI covariates.
+
+Replaces the WhiteboxTools flow-accumulation, wetness-index and
+stream-power runs of the covariate notebook. The DEM should be
+depression-filled first (`fill_depressions`, ideally with `epsilon=True`
+so that filled flats still drain).
+
+Flow directions are computed once per tile from a one-pixel halo and
+cached on disk: D8 sends each cell to its steepest downslope neighbour, and
+D-infinity (Tarboton, 1997) splits it between the two neighbours bounding
+the steepest triangular facet. Every receiver is strictly lower than its
+donor, so within a tile the accumulation is a topological (Kahn) sweep
+that adds each cell to its receivers once its own donors are done.
+
+Tiles are stitched by propagating boundary inflows. Flow leaving a tile
+lands in the tile's halo ring and becomes the inflow of the neighbouring
+tile's edge cells. Rounds re-solve, in parallel, only the tiles whose
+inflow changed; because flow paths never cycle, the rounds end after as
+many steps as the most tile seams any path crosses, with results identical
+to a whole-raster sweep.
+
+TWI = ln(a / tan b) and SPI = a tan b (a: specific catchment area, b: Horn
+slope clamped at `min_slope_deg`) are computed in one fused kernel on the
+final pass, from the same DEM tile that provides the slope.
+
+Typical usage:
+    from geo_tda.hydrology import fill_depressions, wetness_indices
+
+    fill_depressions("dem_aligned.tif", "dem_filled.tif", epsilon=True)
+    wetness_indices("dem_filled.tif", twi_path="twi.tif", spi_path="spi.tif", n_jobs=8)
+"""
+
+from __future__ import annotations
+
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from geo_tda.tda.merge_tree import _NEIGHBORS_8, _open_source, _output_profile
+from geo_tda.utils.jit import njit
+
+from .fill import _perimeter, _tile_bounds
+
+log = logging.getLogger(__name__)
+
+_METHODS = ("d8", "dinf")
+
+# Tarboton facets as (cardinal, diagonal) indices into _NEIGHBORS_8
+_FACETS = np.array([(4, 2), (1, 2), (1, 0), (3, 0), (3, 5), (6, 5), (6, 7), (4, 7)], dtype=np.int64)
+
+
+# ---- Kernels -----------------------------------------------------------------
+
+
+@njit(cache=True, nogil=True)
+def _d8_receivers(zp: np.ndarray, neighbors: np.ndarray):
+    """Steepest-descent receiver of every interior cell of a 1-px haloed tile."""
+    h, w = zp.shape[0] - 2, zp.shape[1] - 2
+    k1 = np.full((h, w), -1, dtype=np.int8)
+    k2 = np.full((h, w), -1, dtype=np.int8)
+    f1 = np.ones((h, w), dtype=np.float32)
+    for r in range(h):
+        for c in range(w):
+            z0 = zp[r + 1, c + 1]
+            if np.isnan(z0):
+                continue
+            best = 0.0
+            for m in range(8):
+                dr, dc = neighbors[m, 0], neighbors[m, 1]
+                zn = zp[r + 1 + dr, c + 1 + dc]
+                if np.isnan(zn):
+                    continue
+                dist = 1.4142135623730951 if dr != 0 and dc != 0 else 1.0
+                drop = (z0 - zn) / dist
+                if drop > best:
+                    best = drop
+                    k1[r, c] = m
+    return k1, k2, f1
+
+
+@njit(cache=True, nogil=True)
+def _dinf_receivers(zp: np.ndarray, neighbors: np.ndarray, facets: np.ndarray):
+    """D-infinity receivers and the share of the first (cardinal) one."""
+    h, w = zp.shape[0] - 2, zp.shape[1] - 2
+    k1 = np.full((h, w), -1, dtype=np.int8)
+    k2 = np.full((h, w), -1, dtype=np.int8)
+    f1 = np.ones((h, w), dtype=np.float32)
+    quarter = np.pi / 4
+    for r in range(h):
+        for c in range(w):
+            z0 = zp[r + 1, c + 1]
+            if np.isnan(z0):
+                continue
+            best = 0.0
+            for f in range(8):
+                a, b = facets[f, 0], facets[f, 1]
+                e1 = zp[r + 1 + neighbors[a, 0], c + 1 + neighbors[a, 1]]
+                e2 = zp[r + 1 + neighbors[b, 0], c + 1 + neighbors[b, 1]]
+                if np.isnan(e1) or np.isnan(e2):
+                    continue
+                s1 = z0 - e1
+                s2 = e1 - e2
+                angle = np.arctan2(s2, s1)
+                slope = np.sqrt(s1 * s1 + s2 * s2)
+                if angle < 0.0:
+                    angle = 0.0
+                    slope = s1
+                elif angle > quarter:
+                    angle = quarter
+                    slope = (z0 - e2) / 1.4142135623730951
+                if slope > best:
+                    best = slope
+                    share = 1.0 - angle / quarter
+                    if share >= 1.0:
+                        k1[r, c], k2[r, c], f1[r, c] = a, -1, 1.0
+                    elif share <= 0.0:
+                        k1[r, c], k2[r, c], f1[r, c] = b, -1, 1.0
+                    else:
+                        k1[r, c], k2[r, c], f1[r, c] = a, b, share
+            if k1[r, c] == -1:
+                # Facets blocked by nodata: fall back to the steepest single neighbour
+                for m in range(8):
+                    dr, dc = neighbors[m, 0], neighbors[m, 1]
+                    zn = zp[r + 1 + dr, c + 1 + dc]
+                    if np.isnan(zn):
+                        continue
+                    drop = (z0 - zn) / (1.4142135623730951 if dr != 0 and dc != 0 else 1.0)
+                    if drop > best:
+                        best = drop
+                        k1[r, c] = m
+    return k1, k2, f1
+
+
+@njit(cache=True, nogil=True)
+def _accumulate_tile(
+    k1: np.ndarray,
+    k2: np.ndarray,
+    f1: np.ndarray,
+    weight: np.ndarray,
+    neighbors: np.ndarray,
+) -> np.ndarray:
+    """
+    Topological accumulation over one tile.
+
+    Returns the (h + 2, w + 2) accumulation: the interior holds each cell's
+    total (own weight plus everything upstream) and the halo ring the flow
+    leaving the tile through each neighbouring cell.
+    """
+    h, w = weight.shape
+    wp = w + 2
+    acc = np.zeros((h + 2) * wp)
+    indeg = np.zeros(h * w, dtype=np.int32)
+    for r in range(h):
+        for c in range(w):
+            acc[(r + 1) * wp + c + 1] = weight[r, c]
+            for j in range(2):
+                k = k1[r, c] if j == 0 else k2[r, c]
+                if k < 0:
+                    continue
+                rr = r + neighbors[k, 0]
+                cc = c + neighbors[k, 1]
+                if 0 <= rr < h and 0 <= cc < w:
+                    indeg[rr * w + cc] += 1
+
+    queue = np.empty(h * w, dtype=np.int64)
+    tail = 0
+    for i in range(h * w):
+        if indeg[i] == 0:
+            queue[tail] = i
+            tail += 1
+    head = 0
+    while head < tail:
+        i = queue[head]
+        head += 1
+        r = i // w
+        c = i - r * w
+        a = acc[(r + 1) * wp + c + 1]
+        for j in range(2):
+            k = k1[r, c] if j == 0 else k2[r, c]
+            if k < 0:
+                continue
+            share = f1[r, c] if j == 0 else 1.0 - f1[r, c]
+            rr = r + neighbors[k, 0]
+            cc = c + neighbors[k, 1]
+            acc[(rr + 1) * wp + cc + 1] += share * a
+            if 0 <= rr < h and 0 <= cc < w:
+                q = rr * w + cc
+                indeg[q] -= 1
+                if indeg[q] == 0:
+                    queue[tail] = q
+                    tail += 1
+    return acc.reshape(h + 2, wp)
+
+
+@njit(cache=True, nogil=True)
+def _wetness_tile(zp: np.ndarray, acc: np.ndarray, cellsize: float, min_tan: float):
+    """Fused Horn slope, TWI and SPI for one tile (1-px haloed DEM)."""
+    h, w = acc.shape
+    twi = np.full((h, w), np.nan, dtype=np.float32)
+    spi = np.full((h, w), np.nan, dtype=np.float32)
+    win = np.empty((3, 3))
+    for r in range(h):
+        for c in range(w):
+            z0 = zp[r + 1, c + 1]
+            if np.isnan(z0):
+                continue
+            for i in range(3):
+                for j in range(3):
+                    v = zp[r + i, c + j]
+                    win[i, j] = z0 if np.isnan(v) else v
+            dzdx = ((win[0, 2] + 2 * win[1, 2] + win[2, 2])
+                    - (win[0, 0] + 2 * win[1, 0] + win[2, 0])) / (8 * cellsize)
+            dzdy = ((win[2, 0] + 2 * win[2, 1] + win[2, 2])
+                    - (win[0, 0] + 2 * win[0, 1] + win[0, 2])) / (8 * cellsize)
+            tan_b = max(np.sqrt(dzdx * dzdx + dzdy * dzdy), min_tan)
+            sca = acc[r, c] * cellsize
+            twi[r, c] = np.log(sca / tan_b)
+            spi[r, c] = sca * tan_b
+    return twi, spi
+
+
+# ---- Tile helpers ------------------------------------------------------------
+
+
+def _read_haloed(source, r0: int, r1: int, c0: int, c1: int, halo: int = 1) -> np.ndarray:
+    """Tile with a NaN-padded halo of `halo` pixels."""
+    nrows, ncols = source.shape
+    rr0, rr1 = max(r0 - halo, 0), min(r1 + halo, nrows)
+    cc0, cc1 = max(c0 - halo, 0), min(c1 + halo, ncols)
+    out = np.full((r1 - r0 + 2 * halo, c1 - c0 + 2 * halo), np.nan)
+    out[rr0 - r0 + halo:rr1 - r0 + halo, cc0 - c0 + halo:cc1 - c0 + halo] = (
+        source.read_window(rr0, rr1, cc0, cc1)
+    )
+    return out
+
+
+def _ring_coords(r0: int, r1: int, c0: int, c1: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Padded-local ring mask and the global (row, col) of every ring cell."""
+    ring = np.ones((r1 - r0 + 2, c1 - c0 + 2), dtype=bool)
+    ring[1:-1, 1:-1] = False
+    rows, cols = np.nonzero(ring)
+    return ring, rows + r0 - 1, cols + c0 - 1
+
+
+def _cellsize(source, cellsize: Optional[float]) -> float:
+    if cellsize is not None:
+        return float(cellsize)
+    if source.profile is not None:
+        return float(abs(source.profile["transform"].a))
+    return 1.0
+
+
+def _map(func, items, n_jobs: int) -> list:
+    if n_jobs > 1 and len(items) > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            return list(pool.map(func, items))
+    return [func(item) for item in items]
+
+
+# ---- Engine ------------------------------------------------------------------
+
+
+def _accumulate(source, method: str, tile_size: int, n_jobs: int, tmp: Path) -> np.ndarray:
+    """Directions per tile, then inflow-propagation rounds; returns the acc memmap."""
+    if method not in _METHODS:
+        raise ValueError(f"method must be one of {_METHODS}, got {method!r}")
+    nrows, ncols = source.shape
+    tiles = list(_tile_bounds(nrows, ncols, tile_size))
+    k1_cache = np.lib.format.open_memmap(tmp / "k1.npy", "w+", np.int8, (nrows, ncols))
+    k2_cache = np.lib.format.open_memmap(tmp / "k2.npy", "w+", np.int8, (nrows, ncols))
+    f1_cache = np.lib.format.open_memmap(tmp / "f1.npy", "w+", np.float32, (nrows, ncols))
+    acc_cache = np.lib.format.open_memmap(tmp / "acc.npy", "w+", np.float64, (nrows, ncols))
+    valid_cache = np.lib.format.open_memmap(tmp / "valid.npy", "w+", np.bool_, (nrows, ncols))
+
+    def directions(t):
+        r0, r1, c0, c1 = tiles[t]
+        zp = _read_haloed(source, r0, r1, c0, c1)
+        if method == "d8":
+            k1, k2, f1 = _d8_receivers(zp, _NEIGHBORS_8)
+        else:
+            k1, k2, f1 = _dinf_receivers(zp, _NEIGHBORS_8, _FACETS)
+        k1_cache[r0:r1, c0:c1] = k1
+        k2_cache[r0:r1, c0:c1] = k2
+        f1_cache[r0:r1, c0:c1] = f1
+        valid_cache[r0:r1, c0:c1] = ~np.isnan(zp[1:-1, 1:-1])
+
+    _map(directions, range(len(tiles)), n_jobs)
+
+    rings = [_ring_coords(*b) for b in tiles]
+    outflow: Dict[int, np.ndarray] = {}
+    inflow: Dict[int, np.ndarray] = {}
+    tile_rows = {r0: i for i, r0 in enumerate(sorted({b[0] for b in tiles}))}
+    tile_cols = {c0: i for i, c0 in enumerate(sorted({b[2] for b in tiles}))}
+    tile_of = {(tile_rows[b[0]], tile_cols[b[2]]): t for t, b in enumerate(tiles)}
+
+    def neighbours(t):
+        ti, tj = tile_rows[tiles[t][0]], tile_cols[tiles[t][2]]
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                u = tile_of.get((ti + di, tj + dj))
+                if u is not None and u != t:
+                    yield u
+
+    def gather(t):
+        """Inflow into tile t's cells from its neighbours' last outflows."""
+        r0, r1, c0, c1 = tiles[t]
+        into = np.zeros((r1 - r0, c1 - c0))
+        for u in neighbours(t):
+            if u not in outflow:
+                continue
+            _, rows, cols = rings[u]
+            inside = (rows >= r0) & (rows < r1) & (cols >= c0) & (cols < c1)
+            np.add.at(into, (rows[inside] - r0, cols[inside] - c0), outflow[u][inside])
+        return into
+
+    def solve(t):
+        r0, r1, c0, c1 = tiles[t]
+        weight = valid_cache[r0:r1, c0:c1].astype(np.float64)
+        if t in inflow:
+            weight.ravel()[_perimeter(weight.shape)] += inflow[t]
+        acc = _accumulate_tile(
+            np.asarray(k1_cache[r0:r1, c0:c1]), np.asarray(k2_cache[r0:r1, c0:c1]),
+            np.asarray(f1_cache[r0:r1, c0:c1]), weight, _NEIGHBORS_8,
+        )
+        acc_cache[r0:r1, c0:c1] = acc[1:-1, 1:-1]
+        return acc[rings[t][0]]
+
+    dirty = list(range(len(tiles)))
+    rounds = 0
+    while dirty:
+        rounds += 1
+        for t, ring in zip(dirty, _map(solve, dirty, n_jobs)):
+            outflow[t] = ring
+        candidates = sorted({u for t in dirty for u in neighbours(t)})
+        dirty = []
+        for u in candidates:
+            # Flow only ever enters a tile through its edge cells
+            into = gather(u)
+            into = into.ravel()[_perimeter(into.shape)]
+            if not np.array_equal(into, inflow.get(u, np.zeros_like(into))):
+                inflow[u] = into
+                dirty.append(u)
+    log.info(
+        "Flow accumulation (%s): %d tiles, %d stitching rounds", method, len(tiles), rounds,
+    )
+    return acc_cache, valid_cache
+
+
+def _open_outputs(source, paths) -> list:
+    """One float32 GeoTIFF writer per non-None path (None entries stay None)."""
+    dsts = []
+    for path in paths:
+        if path is None:
+            dsts.append(None)
+            continue
+        import rasterio
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        dsts.append(rasterio.open(path, "w", **_output_profile(source.profile)))
+    return dsts
+
+
+def _window(r0: int, r1: int, c0: int, c1: int):
+    from rasterio.windows import Window
+
+    return Window(c0, r0, c1 - c0, r1 - r0)
+
+
+def flow_accumulation(
+    dem,
+    out_path: Optional[Union[str, Path]] = None,
+    method: str = "d8",
+    tile_size: int = 2048,
+    nodata: Optional[float] = None,
+    tmp_dir: Optional[Union[str, Path]] = None,
+    n_jobs: int = 1,
+) -> Union[np.ndarray, Path]:
+    """
+    Upslope contributing area, in cells, of every cell of a filled DEM.
+
+    Args:
+        dem: Filled DEM path (band 1, nodata masked) or 2D array.
+        out_path: Optional GeoTIFF path; requires a path DEM for georeferencing.
+        method: 'd8' (single steepest neighbour) or 'dinf' (Tarboton).
+        tile_size: Tile edge in pixels; bounds the memory of each local solve.
+        nodata: Nodata value for array input (NaN is always treated as nodata).
+        tmp_dir: Directory for the on-disk direction / accumulation caches.
+        n_jobs: Worker threads solving tiles concurrently.
+
+    Returns:
+        float32 accumulation including the cell itself (NaN at nodata), or
+        `out_path` when given.
+    """
+    source = _open_source(dem, nodata)
+    if out_path is not None and source.profile is None:
+        source.close()
+        raise ValueError("Writing a raster requires a georeferenced DEM path as input")
+    nrows, ncols = source.shape
+    with tempfile.TemporaryDirectory(dir=tmp_dir, prefix="flow_") as tmp:
+        try:
+            acc_cache, valid_cache = _accumulate(source, method, tile_size, n_jobs, Path(tmp))
+            (dst,) = _open_outputs(source, (out_path,))
+            out = None if dst is not None else np.full((nrows, ncols), np.nan, dtype=np.float32)
+            try:
+                for r0, r1, c0, c1 in _tile_bounds(nrows, ncols, tile_size):
+                    acc = np.where(
+                        valid_cache[r0:r1, c0:c1], acc_cache[r0:r1, c0:c1], np.nan,
+                    ).astype(np.float32)
+                    if dst is not None:
+                        dst.write(acc, 1, window=_window(r0, r1, c0, c1))
+                    else:
+                        out[r0:r1, c0:c1] = acc
+            finally:
+                if dst is not None:
+                    dst.close()
+                    log.info("Wrote %s", out_path)
+            del acc_cache, valid_cache
+        finally:
+            source.close()
+    return out_path if out is None else out
+
+
+def wetness_indices(
+    dem,
+    twi_path: Optional[Union[str, Path]] = None,
+    spi_path: Optional[Union[str, Path]] = None,
+    method: str = "d8",
+    min_slope_deg: float = 0.1,
+    cellsize: Optional[float] = None,
+    tile_size: int = 2048,
+    nodata: Optional[float] = None,
+    tmp_dir: Optional[Union[str, Path]] = None,
+    n_jobs: int = 1,
+) -> Tuple[Union[np.ndarray, Path], Union[np.ndarray, Path]]:
+    """
+    Topographic wetness index and stream power index from a filled DEM.
+
+    The specific catchment area is the accumulation times the cell size
+    (contributing area per unit contour width); slope is Horn's method with
+    nodata neighbours replaced by the centre cell.
+
+    Args:
+        dem: Filled DEM path (band 1, nodata masked) or 2D array.
+        twi_path: Optional GeoTIFF path for TWI.
+        spi_path: Optional GeoTIFF path for SPI.
+        method: Flow routing, 'd8' or 'dinf'.
+        min_slope_deg: Lower slope clamp so flats give finite indices.
+        cellsize: Cell size in map units; defaults to the raster's transform
+            (1.0 for arrays).
+        tile_size: Tile edge in pixels.
+        nodata: Nodata value for array input (NaN is always treated as nodata).
+        tmp_dir: Directory for the on-disk caches.
+        n_jobs: Worker threads solving tiles concurrently.
+
+    Returns:
+        Tuple (twi, spi) of float32 arrays (NaN at nodata), or the output
+        paths when given.
+    """
+    source = _open_source(dem, nodata)
+    if (twi_path is not None or spi_path is not None) and source.profile is None:
+        source.close()
+        raise ValueError("Writing a raster requires a georeferenced DEM path as input")
+    nrows, ncols = source.shape
+    size = _cellsize(source, cellsize)
+    min_tan = float(np.tan(np.radians(min_slope_deg)))
+    paths = (twi_path, spi_path)
+    with tempfile.TemporaryDirectory(dir=tmp_dir, prefix="flow_") as tmp:
+        try:
+            acc_cache, _ = _accumulate(source, method, tile_size, n_jobs, Path(tmp))
+            dsts = _open_outputs(source, paths)
+            outs = [
+                np.full((nrows, ncols), np.nan, dtype=np.float32) if d is None else None
+                for d in dsts
+            ]
+            try:
+                for r0, r1, c0, c1 in _tile_bounds(nrows, ncols, tile_size):
+                    zp = _read_haloed(source, r0, r1, c0, c1)
+                    acc = np.asarray(acc_cache[r0:r1, c0:c1])
+                    for dst, out, band in zip(dsts, outs, _wetness_tile(zp, acc, size, min_tan)):
+                        if dst is not None:
+                            dst.write(band, 1, window=_window(r0, r1, c0, c1))
+                        else:
+                            out[r0:r1, c0:c1] = band
+            finally:
+                for dst, path in zip(dsts, paths):
+                    if dst is not None:
+                        dst.close()
+                        log.info("Wrote %s", path)
+            del acc_cache
+        finally:
+            source.close()
+    twi, spi = (p if o is None else o for p, o in zip(paths, outs))
+    return twi, spi
+
+
+__all__ = ['flow_accumulation', 'wetness_indices']
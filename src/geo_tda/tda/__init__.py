@@ -0,0 +1,73 @@
+"""
+Topological data analysis engines for DEM rasters and point clouds.
+"""
+
+from .landmarks import maxmin_landmarks, lazy_witness_filtration, witness_persistence
+from .cubical import h0_diagram, h1_diagram, persistence_stats
+from .merge_tree import pit_persistence_raster, pit_ridge_persistence_rasters
+from .vectorize import pack_diagrams, batch_landscapes, batch_images
+from .windowed import (
+    sliding_window_tda,
+    sliding_window_summary,
+    lower_star_diagram,
+    persistence_summary,
+    pit_persistence,
+    ridge_persistence,
+    loop_persistence,
+)
+from .window_cache import WindowCache, window_kind
+from .pyramid import build_pyramid, pyramid_tda
+from .diagram_store import DiagramStore, write_window_diagrams, window_diagrams
+from .distances import (
+    wasserstein_distance,
+    bottleneck_distance,
+    distance_matrix,
+    diagram_key,
+    DistanceCache,
+)
+from .permutation import PermutationResult, permutation_test
+
+__all__ = [
+    # Landmarks / witness complexes
+    'maxmin_landmarks',
+    'lazy_witness_filtration',
+    'witness_persistence',
+    # Sliding-window engine
+    'sliding_window_tda',
+    'sliding_window_summary',
+    'lower_star_diagram',
+    'persistence_summary',
+    'pit_persistence',
+    'ridge_persistence',
+    'loop_persistence',
+    # Window short-circuits / memoization
+    'WindowCache',
+    'window_kind',
+    # Multiscale pyramid
+    'build_pyramid',
+    'pyramid_tda',
+    # Whole-raster merge trees
+    'pit_persistence_raster',
+    'pit_ridge_persistence_rasters',
+    # Union-find diagrams
+    'h0_diagram',
+    'h1_diagram',
+    'persistence_stats',
+    # Vectorizers
+    'pack_diagrams',
+    'batch_landscapes',
+    'batch_images',
+    # Diagram store
+    'DiagramStore',
+    'write_window_diagrams',
+    'window_diagrams',
+    # Diagram distances
+    'wasserstein_distance',
+    'bottleneck_distance',
+    'distance_matrix',
+    'diagram_key',
+    'DistanceCache',
+    # Permutation tests
+    'PermutationResult',
+    'permutation_test',
+]
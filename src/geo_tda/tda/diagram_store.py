@@ -0,0 +1,363 @@
+"""
+Columnar persistence-diagram store for sliding-window runs.
+
+The sliding-window engine keeps one summary per window, so trying different
+landscape / image parameters means recomputing every diagram. This module
+persists all per-window diagrams as ragged columnar data in a Zarr group:
+
+    <store>.zarr/
+        zarr.json              attrs: grid shape, tile edges, window, stride, coords, CRS
+        n_pairs                (rows, cols) pair count per window
+        tiles/<ti>_<tj>/       one partition per dask chunk of the DEM
+            window_id          int64   row * n_cols + col on the window grid
+            dim                int8    homology dimension
+            birth, death       float32
+
+Partitions follow the engine's chunk grid, so each dask task writes exactly
+one tile and spatial reads only open the tiles they intersect.
+
+Typical usage:
+    store = write_window_diagrams("dem_aligned.tif", 64, 16, "diagrams.zarr")
+    ids, offsets, births, deaths = store.ragged(rows=slice(0, 100), dim=0)
+    pl = batch_landscapes(offsets, births, deaths, grid)
+"""
+
+from __future__ import annotations
+
+import logging
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .cubical import h0_diagram, h1_diagram
+from .windowed import _block_windows, _prepare_windows
+
+log = logging.getLogger(__name__)
+
+DiagramFunc = Callable[[np.ndarray], Dict[int, np.ndarray]]
+
+_COLUMNS = ("window_id", "dim", "birth", "death")
+
+
+def window_diagrams(
+    window: np.ndarray,
+    dims: Sequence[int] = (0, 1),
+    invert: bool = False,
+    min_persistence: float = 0.0,
+) -> Dict[int, np.ndarray]:
+    """
+    Finite sublevel diagrams of one DEM window, keyed by dimension.
+
+    Args:
+        window: 2D elevation window (NaN = nodata).
+        dims: Homology dimensions to compute (0 and/or 1).
+        invert: Use the superlevel filtration (ridges/peaks).
+        min_persistence: Drop pairs below this lifetime inside the merge, so
+            noise pairs never reach the store or the vectorizers.
+
+    Returns:
+        Dict mapping dimension to a (k, 2) array of finite (birth, death) pairs.
+    """
+    z = -np.asarray(window) if invert else np.asarray(window)
+    out = {}
+    if 0 in dims:
+        h0 = h0_diagram(z, min_persistence=min_persistence)
+        out[0] = h0[np.isfinite(h0[:, 1])]
+    if 1 in dims:
+        h1 = h1_diagram(z, min_persistence=min_persistence)
+        out[1] = h1[np.isfinite(h1[:, 1])]
+    return out
+
+
+def _edges(chunks: Sequence[int]) -> list:
+    return [int(e) for e in np.concatenate(([0], np.cumsum(chunks)))]
+
+
+class DiagramStore:
+    """
+    Zarr-backed ragged store of per-window persistence diagrams.
+
+    Open an existing store with `DiagramStore(path)`; create one with
+    `DiagramStore.create` or `write_window_diagrams`.
+    """
+
+    def __init__(self, path: Union[str, Path], mode: str = "r"):
+        import zarr
+
+        self.path = Path(path)
+        self.root = zarr.open_group(str(self.path), mode=mode)
+        attrs = self.root.attrs
+        self.row_edges = list(attrs["row_edges"])
+        self.col_edges = list(attrs["col_edges"])
+        self.shape = (self.row_edges[-1], self.col_edges[-1])
+
+    @classmethod
+    def create(
+        cls,
+        path: Union[str, Path],
+        row_chunks: Sequence[int],
+        col_chunks: Sequence[int],
+        attrs: Optional[dict] = None,
+        overwrite: bool = False,
+    ) -> "DiagramStore":
+        """
+        Create an empty store partitioned by the given window-grid chunks.
+
+        Args:
+            path: Zarr directory to create.
+            row_chunks: Window rows per tile row (e.g. the engine's cell chunks).
+            col_chunks: Window columns per tile column.
+            attrs: Extra JSON-serialisable metadata (window, stride, CRS, ...).
+            overwrite: Replace an existing store at `path`.
+        """
+        import zarr
+
+        path = Path(path)
+        if path.exists() and not overwrite:
+            raise FileExistsError(f"Diagram store already exists: {path}")
+        root = zarr.open_group(str(path), mode="w")
+        root.attrs.update({
+            **(attrs or {}),
+            "row_edges": _edges(row_chunks),
+            "col_edges": _edges(col_chunks),
+            "columns": list(_COLUMNS),
+        })
+        root.create_group("tiles")
+        return cls(path, mode="r+")
+
+    # ---- Writing -------------------------------------------------------------
+
+    def write_tile(
+        self,
+        ti: int,
+        tj: int,
+        window_id: np.ndarray,
+        dim: np.ndarray,
+        birth: np.ndarray,
+        death: np.ndarray,
+    ) -> None:
+        """Write (or replace) the columns of one tile partition."""
+        grp = self.root.require_group(f"tiles/{ti}_{tj}")
+        columns = {
+            "window_id": np.asarray(window_id, dtype=np.int64),
+            "dim": np.asarray(dim, dtype=np.int8),
+            "birth": np.asarray(birth, dtype=np.float32),
+            "death": np.asarray(death, dtype=np.float32),
+        }
+        for name, values in columns.items():
+            grp.create_array(
+                name, shape=values.shape, dtype=values.dtype,
+                chunks=(max(values.size, 1),), overwrite=True,
+            )[:] = values
+
+    # ---- Reading -------------------------------------------------------------
+
+    def _tile_range(self, sel: Optional[slice], edges: list) -> Tuple[int, int, range]:
+        start, stop, _ = (sel or slice(None)).indices(edges[-1])
+        first = int(np.searchsorted(edges, start, side="right")) - 1
+        last = int(np.searchsorted(edges, max(stop - 1, start), side="right")) - 1
+        return start, stop, range(max(first, 0), min(last, len(edges) - 2) + 1)
+
+    def read(
+        self,
+        rows: Optional[slice] = None,
+        cols: Optional[slice] = None,
+        dims: Optional[Sequence[int]] = None,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Read the pairs of all windows inside a window-grid region.
+
+        Only tiles intersecting the region are opened.
+
+        Args:
+            rows: Window-row slice (step ignored); None for all rows.
+            cols: Window-column slice (step ignored); None for all columns.
+            dims: Homology dimensions to keep; None keeps all.
+
+        Returns:
+            Dict of equal-length columns: window_id, row, col, dim, birth, death,
+            sorted by window_id then dimension.
+        """
+        r0, r1, ti_range = self._tile_range(rows, self.row_edges)
+        c0, c1, tj_range = self._tile_range(cols, self.col_edges)
+        parts = {name: [] for name in _COLUMNS}
+        tiles = self.root["tiles"]
+        for ti in ti_range:
+            for tj in tj_range:
+                key = f"{ti}_{tj}"
+                if key not in tiles:
+                    continue
+                grp = tiles[key]
+                wid = grp["window_id"][:]
+                row, col = np.divmod(wid, self.shape[1])
+                keep = (row >= r0) & (row < r1) & (col >= c0) & (col < c1)
+                dim = grp["dim"][:]
+                if dims is not None:
+                    keep &= np.isin(dim, list(dims))
+                parts["window_id"].append(wid[keep])
+                parts["dim"].append(dim[keep])
+                parts["birth"].append(grp["birth"][:][keep])
+                parts["death"].append(grp["death"][:][keep])
+
+        dtypes = {"window_id": np.int64, "dim": np.int8, "birth": np.float32, "death": np.float32}
+        out = {
+            name: np.concatenate(vals) if vals else np.empty(0, dtype=dtypes[name])
+            for name, vals in parts.items()
+        }
+        order = np.lexsort((out["dim"], out["window_id"]))
+        out = {name: vals[order] for name, vals in out.items()}
+        out["row"], out["col"] = np.divmod(out["window_id"], self.shape[1])
+        return out
+
+    def ragged(
+        self,
+        rows: Optional[slice] = None,
+        cols: Optional[slice] = None,
+        dim: int = 0,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        One dimension of a region as a ragged batch for the vectorizers.
+
+        Every window in the region gets an entry, including windows with no
+        pairs, so the rows of a vectorized matrix line up with `window_ids`.
+
+        Returns:
+            Tuple (window_ids, offsets, births, deaths).
+        """
+        r0, r1, _ = self._tile_range(rows, self.row_edges)
+        c0, c1, _ = self._tile_range(cols, self.col_edges)
+        rr, cc = np.meshgrid(np.arange(r0, r1), np.arange(c0, c1), indexing="ij")
+        window_ids = (rr * self.shape[1] + cc).ravel()
+        cols_ = self.read(rows, cols, dims=[dim])
+        counts = np.bincount(
+            np.searchsorted(window_ids, cols_["window_id"]), minlength=window_ids.size,
+        )
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        return (
+            window_ids, offsets,
+            cols_["birth"].astype(np.float64), cols_["death"].astype(np.float64),
+        )
+
+    def pair_counts(self) -> np.ndarray:
+        """(rows, cols) array of stored pairs per window."""
+        return self.root["n_pairs"][:]
+
+
+# ---- Writer ------------------------------------------------------------------
+
+
+def _store_block(
+    block: np.ndarray,
+    store_path: str,
+    diagram_func: DiagramFunc,
+    window: int,
+    stride: int,
+    halo: int,
+    n_cols: int,
+    block_info=None,
+) -> np.ndarray:
+    """Compute diagrams for one haloed block, write its tile, return pair counts."""
+    views = _block_windows(block, window, stride, halo)
+    ny, nx = views.shape[:2]
+    loc = block_info[None]["chunk-location"]
+    (row0, _), (col0, _) = block_info[None]["array-location"]
+    counts = np.zeros((ny, nx), dtype=np.int32)
+    wids, dims, births, deaths = [], [], [], []
+    for i in range(ny):
+        for j in range(nx):
+            win = views[i, j]
+            if not np.isfinite(win).any():
+                continue
+            wid = (row0 + i) * n_cols + (col0 + j)
+            for dim, dgm in sorted(diagram_func(win).items()):
+                dgm = np.asarray(dgm, dtype=np.float64).reshape(-1, 2)
+                if not dgm.size:
+                    continue
+                wids.append(np.full(len(dgm), wid, dtype=np.int64))
+                dims.append(np.full(len(dgm), dim, dtype=np.int8))
+                births.append(dgm[:, 0])
+                deaths.append(dgm[:, 1])
+                counts[i, j] += len(dgm)
+
+    def cat(parts, dtype):
+        return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+    store = DiagramStore(store_path, mode="r+")
+    store.write_tile(
+        loc[0], loc[1], cat(wids, np.int64), cat(dims, np.int8),
+        cat(births, np.float64), cat(deaths, np.float64),
+    )
+    return counts
+
+
+def write_window_diagrams(
+    dem,
+    window: int,
+    stride: int,
+    store_path: Union[str, Path],
+    diagram_func: Optional[DiagramFunc] = None,
+    halo: Optional[int] = None,
+    chunk_size: int = 2048,
+    scheduler: Optional[str] = None,
+    overwrite: bool = False,
+) -> DiagramStore:
+    """
+    Run the sliding-window engine and store every window's diagrams.
+
+    Windows, halos and chunking are identical to `sliding_window_tda`; each
+    dask chunk writes one tile partition of the store.
+
+    Args:
+        dem: DEM path or 2D DataArray (see `sliding_window_tda`).
+        window: Window size in pixels.
+        stride: Window-grid spacing in pixels.
+        store_path: Zarr directory for the store.
+        diagram_func: Window -> {dim: (k, 2) diagram}. Defaults to finite
+            sublevel H0 and H1 (`window_diagrams`); use e.g.
+            `partial(window_diagrams, min_persistence=0.5)` to keep only
+            pairs above the DEM's vertical accuracy.
+        halo: Chunk overlap (defaults to the minimum).
+        chunk_size: Target chunk edge in pixels.
+        scheduler: Dask scheduler name; None uses the active default.
+        overwrite: Replace an existing store.
+
+    Returns:
+        The populated DiagramStore (pair counts in `pair_counts()`).
+    """
+    diagram_func = diagram_func or window_diagrams
+    src, haloed, cell_chunks, coords, halo = _prepare_windows(
+        dem, window, stride, halo, chunk_size,
+    )
+    n_rows, n_cols = sum(cell_chunks[0]), sum(cell_chunks[1])
+    try:
+        import rioxarray  # noqa: F401  (registers the .rio accessor)
+        crs = src.rio.crs
+    except ImportError:
+        crs = None
+    crs_wkt = crs.to_wkt() if crs is not None else None
+    store = DiagramStore.create(
+        store_path, cell_chunks[0], cell_chunks[1],
+        attrs={
+            "window": window, "stride": stride, "halo": halo,
+            "y": coords["y"].tolist(), "x": coords["x"].tolist(), "crs_wkt": crs_wkt,
+        },
+        overwrite=overwrite,
+    )
+    kernel = partial(
+        _store_block, store_path=str(store_path), diagram_func=diagram_func,
+        window=window, stride=stride, halo=halo, n_cols=n_cols,
+    )
+    counts = haloed.map_blocks(kernel, dtype=np.int32, chunks=cell_chunks)
+    counts = counts.compute(scheduler=scheduler)
+    store.root.create_array(
+        "n_pairs", shape=counts.shape, dtype=np.int32, chunks=(512, 512), overwrite=True,
+    )[:] = counts
+    log.info(
+        "Stored %d pairs for %dx%d windows in %s", int(counts.sum()), n_rows, n_cols, store_path,
+    )
+    return store
+
+
+__all__ = ['DiagramStore', 'write_window_diagrams', 'window_diagrams']
@@ -0,0 +1,179 @@
+"""
+Landmark subsampling and witness complexes for large point clouds.
+
+Greedy max-min (farthest-point) selection keeps the landmarks spread over the
+whole cloud, so the topology of the subsample stays close to the full cloud
+while the complex size is bounded by the number of landmarks. The lazy witness
+complex (de Silva & Carlsson, 2004) then uses every original point as a
+witness, so points dropped by subsampling still shape the filtration.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
+
+log = logging.getLogger(__name__)
+
+
+def _as_point_cloud(points: np.ndarray) -> np.ndarray:
+    """Coerce input to a finite (n, d) float64 array."""
+    pts = np.asarray(points, dtype=np.float64)
+    if pts.ndim == 1:
+        pts = pts.reshape(-1, 1)
+    if pts.ndim != 2:
+        raise ValueError(f"Expected an (n, d) point cloud, got shape {pts.shape}")
+    return pts[np.all(np.isfinite(pts), axis=1)]
+
+
+def maxmin_landmarks(
+    points: np.ndarray,
+    n_landmarks: int,
+    seed: Optional[int] = None,
+    start: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Select landmarks with greedy max-min (farthest-point) sampling.
+
+    Each step adds the point farthest from the current landmark set. Only the
+    points inside the current covering radius of the new landmark can get
+    closer to the set, so the distance update is restricted to a KD-tree ball
+    query instead of a full pass over the cloud.
+
+    Args:
+        points: Point cloud of shape (n, d); 1-D input is treated as (n, 1).
+            Rows with non-finite values are dropped.
+        n_landmarks: Number of landmarks to select (clipped to n).
+        seed: Seed for picking the first landmark when `start` is None.
+        start: Index of the first landmark (after dropping non-finite rows).
+
+    Returns:
+        Tuple of (indices, radii): landmark indices into the finite rows of
+        `points` in selection order, and the covering radius after each
+        selection (radii[k] is the max distance from any point to the first
+        k+1 landmarks).
+    """
+    pts = _as_point_cloud(points)
+    n = pts.shape[0]
+    if n == 0 or n_landmarks <= 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+    n_landmarks = min(int(n_landmarks), n)
+
+    if start is None:
+        start = int(np.random.default_rng(seed).integers(n))
+
+    tree = cKDTree(pts)
+    indices = np.empty(n_landmarks, dtype=np.intp)
+    radii = np.empty(n_landmarks, dtype=np.float64)
+
+    indices[0] = start
+    min_dist = np.linalg.norm(pts - pts[start], axis=1)
+    for k in range(1, n_landmarks):
+        nxt = int(np.argmax(min_dist))
+        radius = min_dist[nxt]
+        radii[k - 1] = radius
+        if radius == 0.0:
+            # Every remaining point duplicates a landmark
+            log.debug("Max-min sampling exhausted distinct points after %d landmarks", k)
+            return indices[:k], radii[:k]
+        indices[k] = nxt
+        near = np.asarray(tree.query_ball_point(pts[nxt], r=radius), dtype=np.intp)
+        if near.size:
+            d = np.linalg.norm(pts[near] - pts[nxt], axis=1)
+            min_dist[near] = np.minimum(min_dist[near], d)
+    radii[-1] = min_dist.max()
+    return indices, radii
+
+
+def lazy_witness_filtration(
+    points: np.ndarray,
+    landmarks: np.ndarray,
+    nu: int = 2,
+    max_bytes: int = 256 * 2**20,
+) -> np.ndarray:
+    """
+    Edge filtration values of the lazy witness complex on a set of landmarks.
+
+    Edge [a, b] enters at min over witnesses w of
+    max(d(a, w), d(b, w)) - m_nu(w), where m_nu(w) is the distance from w to
+    its nu-th nearest landmark (m_0 = 0). Since the lazy complex is the flag
+    complex of its 1-skeleton, the returned matrix can be fed directly to a
+    Vietoris-Rips solver as a distance matrix.
+
+    Args:
+        points: Witness cloud of shape (n, d) (usually the full point cloud).
+        landmarks: Landmark coordinates of shape (L, d).
+        nu: Witness relaxation parameter (0, 1 or 2).
+        max_bytes: Memory budget for the per-chunk (witness, L, L) work array.
+
+    Returns:
+        Symmetric (L, L) float64 matrix of edge filtration values with a
+        zero diagonal.
+    """
+    if nu not in (0, 1, 2):
+        raise ValueError(f"nu must be 0, 1 or 2, got {nu}")
+    pts = _as_point_cloud(points)
+    lms = _as_point_cloud(landmarks)
+    n_lm = lms.shape[0]
+    if n_lm == 0:
+        return np.zeros((0, 0), dtype=np.float64)
+    if pts.shape[0] == 0:
+        raise ValueError("Witness cloud is empty")
+
+    chunk = max(1, int(max_bytes // (8 * n_lm * n_lm)))
+    filt = np.full((n_lm, n_lm), np.inf)
+    for lo in range(0, pts.shape[0], chunk):
+        # Witness-landmark distances are built per chunk too, never (n, L) at once
+        d = cdist(pts[lo:lo + chunk], lms)
+        if nu == 0:
+            m_nu = np.zeros(d.shape[0])
+        elif n_lm >= nu:
+            m_nu = np.partition(d, nu - 1, axis=1)[:, nu - 1]
+        else:
+            m_nu = d.max(axis=1)
+        cost = np.maximum(d[:, :, None], d[:, None, :]) - m_nu[:, None, None]
+        np.minimum(filt, cost.min(axis=0), out=filt)
+
+    np.maximum(filt, 0.0, out=filt)
+    np.fill_diagonal(filt, 0.0)
+    return filt
+
+
+def witness_persistence(
+    points: np.ndarray,
+    n_landmarks: int,
+    maxdim: int = 1,
+    nu: int = 2,
+    seed: Optional[int] = None,
+) -> list:
+    """
+    Persistence diagrams of the lazy witness complex on max-min landmarks.
+
+    Drop-in replacement for running ripser on a strided subsample: landmarks
+    bound the complex size while every point still acts as a witness.
+
+    Args:
+        points: Point cloud of shape (n, d).
+        n_landmarks: Number of max-min landmarks.
+        maxdim: Maximum homology dimension.
+        nu: Witness relaxation parameter (see `lazy_witness_filtration`).
+        seed: Seed for the first landmark.
+
+    Returns:
+        List of (k, 2) birth/death arrays, one per dimension 0..maxdim.
+    """
+    from ripser import ripser
+
+    pts = _as_point_cloud(points)
+    idx, _ = maxmin_landmarks(pts, n_landmarks, seed=seed)
+    if idx.size == 0:
+        return [np.empty((0, 2)) for _ in range(maxdim + 1)]
+    filt = lazy_witness_filtration(pts, pts[idx], nu=nu)
+    return ripser(filt, maxdim=maxdim, distance_matrix=True)["dgms"]
+
+
+__all__ = ['maxmin_landmarks', 'lazy_witness_filtration', 'witness_persistence']
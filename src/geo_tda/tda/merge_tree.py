@@ -0,0 +1,507 @@
+"""
+Whole-raster merge trees for pit and ridge persistence.
+
+Instead of estimating pit persistence per window, the merge tree of the
+entire DEM is built once with union-find over pixels sorted by elevation.
+Every pixel is then assigned the persistence of the branch (basin) it joins
+when it enters the filtration, so basins that cross window or tile edges keep
+their full depth.
+
+The raster is processed in row strips:
+
+1. Each strip runs a local union-find, recording for every pixel the local
+   minimum it attaches to on entry and every local merge (young minimum,
+   elder minimum, saddle height).
+2. Local minima become nodes of a reduced graph whose edges are the local
+   merges plus the 8-neighbour edges crossing strip boundaries. Kruskal on
+   this graph with the elder rule gives the exact global pairing.
+3. A second sweep over the cached strips climbs each pixel's entry minimum
+   to the branch that owns it at the pixel's height and writes persistence.
+
+Ridges use the superlevel filtration (sublevel sets of -z). Both filtrations
+can be built from one read and one sort of each strip.
+
+Kernels are compiled with Numba when it is installed (see
+`geo_tda.utils.jit`).
+"""
+
+from __future__ import annotations
+
+import logging
+import tempfile
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+from geo_tda.utils.jit import njit
+
+log = logging.getLogger(__name__)
+
+_NEIGHBORS_8 = np.array(
+    [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)], dtype=np.int64
+)
+_NEIGHBORS_4 = np.array([(-1, 0), (0, -1), (0, 1), (1, 0)], dtype=np.int64)
+
+
+# ---- Kernels -----------------------------------------------------------------
+
+
+@njit(cache=True)
+def _find(parent: np.ndarray, i: int) -> int:
+    """Union-find root lookup with path halving."""
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+@njit(cache=True)
+def _strip_union_find(
+    z: np.ndarray,
+    order: np.ndarray,
+    n_valid: int,
+    ncols: int,
+    neighbors: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, int]:
+    """
+    Sublevel union-find over one strip.
+
+    Returns (entry, young, old, height, n_edges): `entry[p]` is the local
+    minimum pixel p joins on entry (-1 for nodata), and the edge arrays list
+    local merges of a younger minimum into an elder one at a saddle height.
+    """
+    n = z.shape[0]
+    nrows = n // ncols
+    parent = np.full(n, -1, dtype=np.int64)
+    rank = np.empty(n, dtype=np.int64)
+    entry = np.full(n, -1, dtype=np.int64)
+    young = np.empty(n_valid, dtype=np.int64)
+    old = np.empty(n_valid, dtype=np.int64)
+    height = np.empty(n_valid, dtype=np.float64)
+    n_edges = 0
+
+    for k in range(n):
+        rank[order[k]] = k
+
+    for k in range(n_valid):
+        p = order[k]
+        parent[p] = p
+        root = p
+        r = p // ncols
+        c = p - r * ncols
+        for m in range(neighbors.shape[0]):
+            rr = r + neighbors[m, 0]
+            cc = c + neighbors[m, 1]
+            if rr < 0 or rr >= nrows or cc < 0 or cc >= ncols:
+                continue
+            q = rr * ncols + cc
+            if parent[q] == -1:
+                continue
+            rq = _find(parent, q)
+            if rq == root:
+                continue
+            if rank[rq] < rank[root]:
+                y, o = root, rq
+            else:
+                y, o = rq, root
+            parent[y] = o
+            if y != p:
+                young[n_edges] = y
+                old[n_edges] = o
+                height[n_edges] = z[p]
+                n_edges += 1
+            root = o
+        entry[p] = root
+    return entry, young, old, height, n_edges
+
+
+@njit(cache=True)
+def _elder_kruskal(
+    u: np.ndarray,
+    v: np.ndarray,
+    h: np.ndarray,
+    birth: np.ndarray,
+    node_key: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Kruskal over height-sorted edges between minima using the elder rule.
+
+    Returns (up, death): when a branch dies it points `up` to the elder
+    branch that absorbed it; surviving branches keep death = +inf.
+    """
+    n = birth.shape[0]
+    parent = np.arange(n)
+    up = np.arange(n)
+    death = np.full(n, np.inf)
+    for e in range(u.shape[0]):
+        a = _find(parent, u[e])
+        b = _find(parent, v[e])
+        if a == b:
+            continue
+        if birth[a] < birth[b] or (birth[a] == birth[b] and node_key[a] < node_key[b]):
+            y, o = b, a
+        else:
+            y, o = a, b
+        parent[y] = o
+        up[y] = o
+        death[y] = h[e]
+    return up, death
+
+
+def _climb(node: np.ndarray, z: np.ndarray, up: np.ndarray, death: np.ndarray) -> np.ndarray:
+    """Move each pixel's entry minimum up to the branch owning it at height z."""
+    node = node.copy()
+    active = np.flatnonzero(death[node] <= z)
+    while active.size:
+        node[active] = up[node[active]]
+        active = active[death[node[active]] <= z[active]]
+    return node
+
+
+# ---- Strip sources -----------------------------------------------------------
+
+
+class _ArraySource:
+    """Strip / window reader over an in-memory 2D array."""
+
+    def __init__(self, arr: np.ndarray, nodata: Optional[float] = None):
+        self.arr = arr
+        self.nodata = nodata
+        self.shape = arr.shape
+        self.profile = None
+
+    def read(self, r0: int, r1: int) -> np.ndarray:
+        return self.read_window(r0, r1, 0, self.shape[1])
+
+    def read_window(self, r0: int, r1: int, c0: int, c1: int) -> np.ndarray:
+        block = np.asarray(self.arr[r0:r1, c0:c1], dtype=np.float64)
+        if self.nodata is not None:
+            block = np.where(block == self.nodata, np.nan, block)
+        return block
+
+    def close(self):
+        pass
+
+
+class _RasterSource:
+    """Strip / window reader over band 1 of a raster file."""
+
+    def __init__(self, path: Union[str, Path]):
+        import rasterio
+
+        self.ds = rasterio.open(path)
+        self.shape = (self.ds.height, self.ds.width)
+        self.profile = self.ds.profile.copy()
+
+    def read(self, r0: int, r1: int) -> np.ndarray:
+        return self.read_window(r0, r1, 0, self.shape[1])
+
+    def read_window(self, r0: int, r1: int, c0: int, c1: int) -> np.ndarray:
+        from rasterio.windows import Window
+
+        win = Window(c0, r0, c1 - c0, r1 - r0)
+        block = self.ds.read(1, window=win, masked=True).astype(np.float64)
+        return block.filled(np.nan)
+
+    def close(self):
+        self.ds.close()
+
+
+def _open_source(dem, nodata: Optional[float]):
+    if isinstance(dem, (str, Path)):
+        return _RasterSource(dem)
+    arr = np.asarray(dem)
+    if arr.ndim != 2:
+        raise ValueError(f"Expected a 2D DEM, got shape {arr.shape}")
+    return _ArraySource(arr, nodata)
+
+
+def _output_profile(profile: dict) -> dict:
+    out = profile.copy()
+    out.update(
+        driver="GTiff", count=1, dtype="float32", nodata=np.nan,
+        tiled=True, blockxsize=256, blockysize=256, compress="LZW",
+    )
+    return out
+
+
+# ---- Engine ------------------------------------------------------------------
+
+
+def _superlevel_order(order: np.ndarray, n_valid: int) -> np.ndarray:
+    """Ascending order of -z from the ascending order of z (nodata stays last)."""
+    return np.concatenate((order[:n_valid][::-1], order[n_valid:]))
+
+
+def _build_merge_trees(
+    source,
+    z_cache: np.ndarray,
+    entry_caches: Tuple[np.ndarray, ...],
+    strip_rows: int,
+    neighbors: np.ndarray,
+    negates: Tuple[bool, ...],
+) -> list:
+    """
+    Pass 1 + global merge for one or more filtrations of the same DEM.
+
+    Each strip is read and sorted once; superlevel (negated) filtrations
+    reuse the sublevel order reversed. Fills the caches and returns one
+    (nodes, up, death, birth, z_max) tuple per filtration, z_max being the
+    highest valid value of the filtration (NaN without valid pixels).
+    """
+    nrows, ncols = source.shape
+    n_filt = len(negates)
+    us = [[] for _ in range(n_filt)]
+    vs = [[] for _ in range(n_filt)]
+    hs = [[] for _ in range(n_filt)]
+    node_ids = [[] for _ in range(n_filt)]
+    z_lo, z_hi = np.inf, -np.inf
+    prev_last = [None] * n_filt  # (z, entry) of the previous strip's last row
+    down_offsets = np.unique(neighbors[neighbors[:, 0] == 1, 1])
+    n_strips = 0
+
+    for r0 in range(0, nrows, strip_rows):
+        r1 = min(r0 + strip_rows, nrows)
+        zf = source.read(r0, r1).ravel()
+        order = np.argsort(zf, kind="stable")
+        n_valid = int(np.count_nonzero(~np.isnan(zf)))
+        if n_valid:
+            z_lo = min(z_lo, zf[order[0]])
+            z_hi = max(z_hi, zf[order[n_valid - 1]])
+        offset = r0 * ncols
+        z_cache[offset:offset + zf.size] = zf
+
+        for f, negate in enumerate(negates):
+            zs = -zf if negate else zf
+            ords = _superlevel_order(order, n_valid) if negate else order
+            entry, young, old, height, n_edges = _strip_union_find(
+                zs, ords, n_valid, ncols, neighbors,
+            )
+            entry = np.where(entry >= 0, entry + offset, -1)
+            entry_caches[f][offset:offset + zf.size] = entry
+            node_ids[f].append(np.unique(entry[entry >= 0]))
+            us[f].append(young[:n_edges] + offset)
+            vs[f].append(old[:n_edges] + offset)
+            hs[f].append(height[:n_edges])
+
+            if prev_last[f] is not None:
+                # Edges between the previous strip's last row and this strip's first row
+                z_up, e_up = prev_last[f]
+                z_dn, e_dn = zs[:ncols], entry[:ncols]
+                for dc in down_offsets:
+                    a = np.arange(max(0, -dc), min(ncols, ncols - dc))
+                    b = a + dc
+                    ok = (e_up[a] >= 0) & (e_dn[b] >= 0)
+                    us[f].append(e_up[a][ok])
+                    vs[f].append(e_dn[b][ok])
+                    hs[f].append(np.maximum(z_up[a][ok], z_dn[b][ok]))
+            prev_last[f] = (zs[-ncols:].copy(), entry[-ncols:].copy())
+        n_strips += 1
+
+    trees = []
+    for f, negate in enumerate(negates):
+        u = np.concatenate(us[f])
+        v = np.concatenate(vs[f])
+        h = np.concatenate(hs[f])
+        # Per-strip node ids keep the full entry cache on disk
+        nodes = np.unique(np.concatenate(node_ids[f]))
+        birth = -z_cache[nodes] if negate else np.asarray(z_cache[nodes])
+        # Tie-break equal births the same way the reversed strip order does
+        node_key = -nodes if negate else nodes
+        order = np.argsort(h, kind="stable")
+        up, death = _elder_kruskal(
+            np.searchsorted(nodes, u[order]),
+            np.searchsorted(nodes, v[order]),
+            h[order],
+            birth,
+            node_key,
+        )
+        log.info(
+            "%s merge tree: %d strips, %d extrema, %d reduced edges, %d essential branches",
+            "Superlevel" if negate else "Sublevel",
+            n_strips, nodes.size, u.size, int(np.isinf(death).sum()),
+        )
+        z_max = (-z_lo if negate else z_hi) if nodes.size else np.nan
+        trees.append((nodes, up, death, birth, float(z_max)))
+    return trees
+
+
+def _branch_persistence(death: np.ndarray, birth: np.ndarray, z_max: float) -> np.ndarray:
+    """Per-branch persistence; essential branches run to the highest valid pixel."""
+    return np.where(np.isfinite(death), death, z_max) - birth
+
+
+def pit_persistence_raster(
+    dem,
+    out_path: Optional[Union[str, Path]] = None,
+    strip_rows: int = 1024,
+    connectivity: int = 8,
+    nodata: Optional[float] = None,
+    tmp_dir: Optional[Union[str, Path]] = None,
+) -> Union[np.ndarray, Path]:
+    """
+    Per-pixel persistence of the basin each pixel drains into.
+
+    The basin of a pixel is the merge-tree branch that owns it when it enters
+    the sublevel filtration: the oldest (lowest) minimum of its connected
+    component at the pixel's own elevation. Its persistence is the saddle
+    height at which that minimum merges into an older one minus the minimum's
+    elevation. Branches that never merge (one per connected data region)
+    are given the height range up to the highest valid pixel in the raster.
+
+    Args:
+        dem: DEM path (band 1, nodata masked) or 2D array.
+        out_path: Optional GeoTIFF path; requires a path DEM for georeferencing.
+        strip_rows: Rows per strip; bounds peak memory of the local pass.
+        connectivity: Pixel adjacency, 8 (default) or 4.
+        nodata: Nodata value for array input (NaN is always treated as nodata).
+        tmp_dir: Directory for the on-disk per-pixel caches.
+
+    Returns:
+        float32 persistence array (NaN at nodata), or `out_path` when given.
+    """
+    return _persistence_rasters(
+        dem, (False,), (out_path,), strip_rows, connectivity, nodata, tmp_dir,
+    )[0]
+
+
+def pit_ridge_persistence_rasters(
+    dem,
+    pit_path: Optional[Union[str, Path]] = None,
+    ridge_path: Optional[Union[str, Path]] = None,
+    strip_rows: int = 1024,
+    connectivity: int = 8,
+    nodata: Optional[float] = None,
+    tmp_dir: Optional[Union[str, Path]] = None,
+) -> Tuple[Union[np.ndarray, Path], Union[np.ndarray, Path]]:
+    """
+    Pit and ridge persistence rasters from a single read and sort of the DEM.
+
+    Pits use the sublevel filtration exactly as `pit_persistence_raster`;
+    ridges/peaks use the superlevel filtration (sublevel sets of -z), built
+    from the same per-strip elevation sort reversed. Ridge persistence is
+    reported as a positive height difference: the drop from a peak to the
+    saddle where its branch joins a higher one.
+
+    Args:
+        dem: DEM path (band 1, nodata masked) or 2D array.
+        pit_path: Optional GeoTIFF path for pit persistence.
+        ridge_path: Optional GeoTIFF path for ridge persistence.
+        strip_rows: Rows per strip; bounds peak memory of the local pass.
+        connectivity: Pixel adjacency, 8 (default) or 4.
+        nodata: Nodata value for array input (NaN is always treated as nodata).
+        tmp_dir: Directory for the on-disk per-pixel caches.
+
+    Returns:
+        Tuple (pit, ridge) of float32 arrays, or the output paths when given.
+    """
+    pit, ridge = _persistence_rasters(
+        dem, (False, True), (pit_path, ridge_path), strip_rows, connectivity, nodata, tmp_dir,
+    )
+    return pit, ridge
+
+
+def _persistence_rasters(
+    dem,
+    negates: Tuple[bool, ...],
+    out_paths: Tuple[Optional[Union[str, Path]], ...],
+    strip_rows: int,
+    connectivity: int,
+    nodata: Optional[float],
+    tmp_dir: Optional[Union[str, Path]],
+) -> list:
+    """Shared driver: one DEM pass for all filtrations, then one write per output."""
+    if connectivity not in (4, 8):
+        raise ValueError(f"connectivity must be 4 or 8, got {connectivity}")
+    neighbors = _NEIGHBORS_8 if connectivity == 8 else _NEIGHBORS_4
+    source = _open_source(dem, nodata)
+    if any(p is not None for p in out_paths) and source.profile is None:
+        source.close()
+        raise ValueError("Writing a raster requires a georeferenced DEM path as input")
+
+    nrows, ncols = source.shape
+    n = nrows * ncols
+    results = []
+    with tempfile.TemporaryDirectory(dir=tmp_dir, prefix="merge_tree_") as tmp:
+        try:
+            z_cache = np.lib.format.open_memmap(
+                Path(tmp) / "z.npy", mode="w+", dtype=np.float64, shape=(n,),
+            )
+            entry_caches = tuple(
+                np.lib.format.open_memmap(
+                    Path(tmp) / f"entry_{f}.npy", mode="w+", dtype=np.int64, shape=(n,),
+                )
+                for f in range(len(negates))
+            )
+            trees = _build_merge_trees(
+                source, z_cache, entry_caches, strip_rows, neighbors, negates,
+            )
+            for negate, out_path, entry_cache, (nodes, up, death, birth, z_max) in zip(
+                negates, out_paths, entry_caches, trees,
+            ):
+                pers = _branch_persistence(death, birth, z_max)
+                results.append(
+                    _write_persistence(
+                        source, z_cache, entry_cache, nodes, up, death, pers,
+                        strip_rows, out_path, negate,
+                    )
+                )
+            del z_cache, entry_caches
+        finally:
+            source.close()
+    return results
+
+
+def _write_persistence(
+    source,
+    z_cache: np.ndarray,
+    entry_cache: np.ndarray,
+    nodes: np.ndarray,
+    up: np.ndarray,
+    death: np.ndarray,
+    pers: np.ndarray,
+    strip_rows: int,
+    out_path: Optional[Union[str, Path]],
+    negate: bool = False,
+) -> Union[np.ndarray, Path]:
+    """Pass 2: climb cached entries strip by strip and emit persistence."""
+    nrows, ncols = source.shape
+    dst = None
+    out = None
+    if out_path is not None:
+        import rasterio
+        from rasterio.windows import Window
+
+        out_path = Path(out_path)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        dst = rasterio.open(out_path, "w", **_output_profile(source.profile))
+    else:
+        out = np.full((nrows, ncols), np.nan, dtype=np.float32)
+
+    try:
+        for r0 in range(0, nrows, strip_rows):
+            r1 = min(r0 + strip_rows, nrows)
+            sl = slice(r0 * ncols, r1 * ncols)
+            entry = np.asarray(entry_cache[sl])
+            z = np.asarray(z_cache[sl])
+            if negate:
+                z = -z
+            strip = np.full(entry.size, np.nan, dtype=np.float32)
+            valid = entry >= 0
+            if valid.any():
+                node = _climb(np.searchsorted(nodes, entry[valid]), z[valid], up, death)
+                strip[valid] = pers[node]
+            strip = strip.reshape(r1 - r0, ncols)
+            if dst is not None:
+                dst.write(strip, 1, window=Window(0, r0, ncols, r1 - r0))
+            else:
+                out[r0:r1] = strip
+    finally:
+        if dst is not None:
+            dst.close()
+            log.info("Wrote %s", out_path)
+    return out_path if dst is not None else out
+
+
+__all__ = ['pit_persistence_raster', 'pit_ridge_persistence_rasters']
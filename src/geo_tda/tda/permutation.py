@@ -0,0 +1,182 @@
+"""
+Batched permutation tests for group differences in landscape features.
+
+Protocol 11.2 compares provinces by the distance between group centroids of
+persistence-landscape vectors and calibrates it against label shuffles. A
+shuffle only changes which rows are averaged together, so a whole batch of
+permutations reduces to one matrix product: with W the (B, n) matrix of
+per-permutation averaging weights, W @ X holds B centroid differences at
+once. Batches are sized to a memory budget and run on a thread pool (the
+products release the GIL), so 10,000 permutations take a handful of BLAS
+calls instead of 10,000 Python iterations.
+
+When features outnumber samples the product runs against the Gram matrix
+X X^T instead (||W X||^2 = W K W^T), which is cheaper for long landscapes.
+
+Typical usage:
+    pl = batch_landscapes(offsets, births, deaths, grid, n_layers=3)
+    result = permutation_test(pl, provinces, n_permutations=9999, seed=0)
+    print(result.statistic, result.p_value)
+"""
+
+from __future__ import annotations
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+_STATISTICS = ("centroid", "between")
+
+
+@dataclass
+class PermutationResult:
+    """Observed statistic, permutation p-value and the null distribution."""
+    statistic: float
+    p_value: float
+    null: np.ndarray
+    n_permutations: int
+    statistic_name: str
+
+    def __str__(self):
+        return (
+            f"{self.statistic_name} = {self.statistic:.6g}, "
+            f"p = {self.p_value:.4g} ({self.n_permutations} permutations)"
+        )
+
+
+def _weights(codes: np.ndarray, counts: np.ndarray, statistic: str) -> np.ndarray:
+    """(B, R, n) contrast weights whose squared norms sum to the statistic."""
+    if statistic == "centroid":
+        # One contrast row: mean of group 0 minus mean of group 1
+        w = np.where(codes == 0, 1.0 / counts[0], -1.0 / counts[1])
+        return w[:, None, :]
+    # One row per group, scaled so that sum_g ||S_g||^2 / n_g falls out
+    groups = np.arange(counts.size)[None, :, None]
+    return (codes[:, None, :] == groups) / np.sqrt(counts)[None, :, None]
+
+
+def _statistics(
+    codes: np.ndarray,
+    counts: np.ndarray,
+    statistic: str,
+    x: np.ndarray,
+    gram: Optional[np.ndarray],
+) -> np.ndarray:
+    """Statistic of each row of a (B, n) batch of group codes."""
+    w = _weights(codes, counts, statistic)
+    b, r, n = w.shape
+    flat = w.reshape(b * r, n)
+    if gram is not None:
+        sq = np.einsum("ij,ij->i", flat @ gram, flat)
+    else:
+        proj = flat @ x
+        sq = np.einsum("ij,ij->i", proj, proj)
+    total = sq.reshape(b, r).sum(axis=1)
+    if statistic == "centroid":
+        return np.sqrt(np.maximum(total, 0.0))
+    return total
+
+
+def _null_chunk(
+    codes: np.ndarray,
+    counts: np.ndarray,
+    statistic: str,
+    x: np.ndarray,
+    gram: Optional[np.ndarray],
+    size: int,
+    seed: np.random.SeedSequence,
+) -> np.ndarray:
+    """Statistics of `size` random relabelings."""
+    rng = np.random.default_rng(seed)
+    shuffled = rng.permuted(np.tile(codes, (size, 1)), axis=1)
+    return _statistics(shuffled, counts, statistic, x, gram)
+
+
+def permutation_test(
+    features: np.ndarray,
+    labels: Sequence,
+    n_permutations: int = 9999,
+    statistic: str = "centroid",
+    seed: Optional[int] = None,
+    n_jobs: int = 1,
+    chunk_size: Optional[int] = None,
+    memory_mb: float = 256.0,
+) -> PermutationResult:
+    """
+    Permutation test for differences between groups of feature vectors.
+
+    Args:
+        features: (n_samples, n_features) matrix, e.g. stacked landscapes.
+        labels: Group label of each sample.
+        n_permutations: Number of label shuffles.
+        statistic: 'centroid' for the Euclidean distance between the two
+            group means (Protocol 11.2; exactly two groups), or 'between'
+            for the between-group sum of squares (any number of groups;
+            ranks permutations like PERMANOVA's pseudo-F since the total sum
+            of squares does not change under relabeling).
+        seed: Seed for the shuffles; results do not depend on `n_jobs`.
+        n_jobs: Worker threads for the batched products.
+        chunk_size: Permutations per batch; None sizes batches to `memory_mb`.
+        memory_mb: Approximate working-memory budget per batch.
+
+    Returns:
+        PermutationResult with p = (#{null >= observed} + 1) / (n_permutations + 1).
+    """
+    if statistic not in _STATISTICS:
+        raise ValueError(f"statistic must be one of {_STATISTICS}, got {statistic!r}")
+    x = np.asarray(features, dtype=np.float64)
+    if x.ndim != 2:
+        raise ValueError(f"features must be 2D, got shape {x.shape}")
+    if not np.isfinite(x).all():
+        raise ValueError("features contain non-finite values")
+    _, codes, counts = np.unique(np.asarray(labels), return_inverse=True, return_counts=True)
+    codes = codes.ravel()
+    if codes.size != x.shape[0]:
+        raise ValueError(f"{codes.size} labels for {x.shape[0]} samples")
+    if counts.size < 2:
+        raise ValueError("Need at least two groups")
+    if statistic == "centroid" and counts.size != 2:
+        raise ValueError(f"'centroid' compares two groups, got {counts.size}")
+
+    n, d = x.shape
+    x = x - x.mean(axis=0)
+    gram = x @ x.T if n < d else None
+    observed = float(_statistics(codes[None, :], counts, statistic, x, gram)[0])
+
+    rows = 1 if statistic == "centroid" else counts.size
+    if chunk_size is None:
+        per_perm = 8 * rows * (2 * n + min(n, d))
+        chunk_size = int(max(1, memory_mb * 2**20 // per_perm))
+    chunk_size = max(1, min(chunk_size, n_permutations))
+    sizes = [chunk_size] * (n_permutations // chunk_size)
+    if n_permutations % chunk_size:
+        sizes.append(n_permutations % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    log.info(
+        "Permutation test: %d samples, %d features, %d groups, %d permutations in %d batches",
+        n, d, counts.size, n_permutations, len(sizes),
+    )
+
+    def run(k):
+        return _null_chunk(codes, counts, statistic, x, gram, sizes[k], seeds[k])
+
+    if n_jobs > 1 and len(sizes) > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            parts = list(pool.map(run, range(len(sizes))))
+    else:
+        parts = [run(k) for k in range(len(sizes))]
+    null = np.concatenate(parts) if parts else np.empty(0)
+
+    # Relative tolerance so that relabelings reproducing the observed
+    # grouping are not lost to rounding
+    exceed = np.count_nonzero(null >= observed * (1 - 1e-10))
+    p_value = (exceed + 1) / (n_permutations + 1)
+    return PermutationResult(observed, p_value, null, n_permutations, statistic)
+
+
+__all__ = ['PermutationResult', 'permutation_test']
@@ -0,0 +1,92 @@
+"""
+Degenerate-window short-circuits and content-hash memoization.
+
+Province DEMs contain large nodata masks, flat water bodies and repeated
+edge patterns. The windowed kernels test each window here first: all-nodata
+and constant windows are answered without running persistence, and
+everything else is looked up in a bounded LRU keyed by a hash of the
+window's (optionally quantized) content.
+
+Caches live for one dask block, so they need no locking under threaded
+schedulers; repeated content within a chunk is where most of the reuse is.
+With `quantum=None` keys are exact and results are unchanged; a positive
+quantum also merges windows that differ by less than the DEM's vertical
+precision.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+
+# Kernels append these per-cell flag channels after their feature channels
+SKIPPED, CACHE_HIT = 0, 1
+N_FLAGS = 2
+
+_NAN_KEY = np.iinfo(np.int64).min
+
+
+def window_kind(window: np.ndarray) -> Optional[str]:
+    """'nodata' for all-NaN windows, 'constant' for flat ones, else None."""
+    finite = window[~np.isnan(window)]
+    if finite.size == 0:
+        return "nodata"
+    if finite.min() == finite.max():
+        return "constant"
+    return None
+
+
+class WindowCache:
+    """
+    Bounded LRU of per-window results keyed by a content hash.
+
+    Args:
+        max_entries: Maximum number of cached results (0 disables caching).
+        quantum: Height quantization step for keys; None hashes exact values.
+    """
+
+    def __init__(self, max_entries: int = 4096, quantum: Optional[float] = None):
+        self.max_entries = max_entries
+        self.quantum = quantum
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, window: np.ndarray) -> bytes:
+        """Digest of the window's shape, nodata mask and (quantized) heights."""
+        if self.quantum:
+            q = np.round(window / self.quantum)
+            values = np.where(np.isnan(q), _NAN_KEY, q).astype(np.int64)
+        else:
+            values = np.where(np.isnan(window), np.inf, window).astype(np.float64)
+        h = hashlib.blake2b(digest_size=16)
+        h.update(np.asarray(window.shape, dtype=np.int64).tobytes())
+        h.update(np.ascontiguousarray(values).tobytes())
+        return h.digest()
+
+    def get(self, key: bytes) -> Any:
+        """Cached value for `key` (marked most recent), or None."""
+        if not self.max_entries:
+            return None
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: bytes, value: Any) -> None:
+        """Store a value, evicting the least recently used entry when full."""
+        if not self.max_entries:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+__all__ = ['WindowCache', 'window_kind']
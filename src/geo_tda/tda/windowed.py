@@ -0,0 +1,535 @@
+"""
+Sliding-window TDA engine over DEM rasters.
+
+Production version of the notebook's `calculate_tda_pit_persistence` +
+`dask.array.map_blocks` pipeline (protocols 7.1 / 8.1). The DEM is split
+into dask chunks whose sizes are multiples of the stride, each chunk is read
+once with a halo wide enough to hold every window centred in it, and a
+pluggable per-window function turns each window into one or more summary
+values. Output cells are stride x stride blocks snapped to the source grid.
+
+Typical usage:
+    from geo_tda.tda import sliding_window_tda
+
+    pit = sliding_window_tda(
+        "dem_aligned.tif", window=64, stride=16,
+        out_path="tda_pit_persistence.tif",
+    )
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+from functools import partial
+from pathlib import Path
+from typing import Callable, Optional, Sequence, Union
+
+import numpy as np
+
+from .cubical import STATS, persistence_stats
+from .incremental import incremental_block
+from .window_cache import CACHE_HIT, N_FLAGS, SKIPPED, WindowCache, window_kind
+
+log = logging.getLogger(__name__)
+
+WindowFunc = Callable[[np.ndarray], Union[float, Sequence[float], np.ndarray]]
+
+
+# ---- Per-window summaries ----------------------------------------------------
+
+
+def lower_star_diagram(window: np.ndarray, invert: bool = False) -> np.ndarray:
+    """
+    H0 diagram of the sublevel (lower-star) filtration of a DEM window.
+
+    Nodata (NaN) pixels are raised to the window maximum so they never create
+    minima of their own. Use `invert=True` for ridges/peaks (superlevel sets);
+    births and deaths are then reported on the negated heights.
+
+    Args:
+        window: 2D elevation window.
+        invert: Analyse -window instead of window.
+
+    Returns:
+        (k, 2) array of finite (birth, death) pairs.
+    """
+    from ripser import lower_star_img
+
+    img = -window if invert else window
+    img = np.asarray(img, dtype=np.float64)
+    finite = np.isfinite(img)
+    if not finite.any():
+        return np.empty((0, 2))
+    if not finite.all():
+        img = np.where(finite, img, img[finite].max())
+    dgm = lower_star_img(img)
+    return dgm[np.isfinite(dgm[:, 1])]
+
+
+def persistence_summary(
+    window: np.ndarray,
+    stat: str = "total",
+    invert: bool = False,
+    min_valid: int = 10,
+    dim: int = 0,
+    min_persistence: float = 0.0,
+) -> float:
+    """
+    Scalar summary of a window's sublevel persistence diagram.
+
+    Args:
+        window: 2D elevation window.
+        stat: 'total' (sum of lifetimes, the L1 norm of the persistence
+            landscape used in the notebook), 'max', 'count' or 'entropy'.
+        invert: Summarise ridges (superlevel sets) instead of pits.
+        min_valid: Windows with fewer valid pixels return NaN.
+        dim: Homology dimension: 0 (pits, or peaks when inverted) or 1
+            (enclosed loops, computed by duality in `h1_diagram`).
+        min_persistence: Ignore pairs with shorter lifetimes (tau).
+
+    Statistics are accumulated inside the union-find merge (see
+    `persistence_stats`); H0 follows `lower_star_diagram`'s conventions.
+
+    Returns:
+        Summary value (0.0 when the window has no finite pairs).
+    """
+    finite = np.isfinite(window)
+    if np.count_nonzero(finite) < min_valid:
+        return np.nan
+    if stat not in STATS:
+        raise ValueError(f"Unknown summary stat: {stat!r}")
+    z = -np.asarray(window, dtype=np.float64) if invert else np.asarray(window, dtype=np.float64)
+    if dim == 0 and not finite.all():
+        # Lower-star convention: nodata enters last, at the window maximum
+        z = np.where(finite, z, z[finite].max())
+    stats = persistence_stats(z, dim=dim, min_persistence=min_persistence)
+    return stats[stat]
+
+
+def pit_persistence(window: np.ndarray) -> float:
+    """Total H0 persistence of pits (sublevel sets)."""
+    return persistence_summary(window, stat="total")
+
+
+def ridge_persistence(window: np.ndarray) -> float:
+    """Total H0 persistence of ridges/peaks (superlevel sets)."""
+    return persistence_summary(window, stat="total", invert=True)
+
+
+def loop_persistence(window: np.ndarray) -> float:
+    """Total H1 persistence of enclosed loops (rings of high terrain)."""
+    return persistence_summary(window, stat="total", dim=1)
+
+
+# ---- Block kernel ------------------------------------------------------------
+
+
+def _block_windows(block: np.ndarray, window: int, stride: int, halo: int) -> np.ndarray:
+    """(ny, nx, window, window) view of the windows centred on a haloed block's cells."""
+    depth = (window - stride) // 2
+    ny = (block.shape[0] - 2 * halo) // stride
+    nx = (block.shape[1] - 2 * halo) // stride
+    if ny <= 0 or nx <= 0:
+        return np.empty((max(ny, 0), max(nx, 0), window, window), dtype=block.dtype)
+    core = block[halo - depth:, halo - depth:]
+    views = np.lib.stride_tricks.sliding_window_view(core, (window, window))
+    return views[::stride, ::stride][:ny, :nx]
+
+
+def _window_block(
+    block: np.ndarray,
+    func: WindowFunc,
+    window: int,
+    stride: int,
+    halo: int,
+    n_features: int,
+    cache_size: int = 0,
+    quantum: Optional[float] = None,
+    constant_value: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Apply `func` to every window centred on a stride cell of one haloed block.
+
+    Returns (n_features + N_FLAGS, ny, nx): features followed by the
+    skipped / cache-hit flag channels of `geo_tda.tda.window_cache`.
+    """
+    views = _block_windows(block, window, stride, halo)
+    ny, nx = views.shape[:2]
+    out = np.full((n_features + N_FLAGS, ny, nx), np.nan, dtype=np.float32)
+    flags = out[n_features:]
+    flags[:] = 0
+    cache = WindowCache(cache_size, quantum)
+    for i in range(ny):
+        for j in range(nx):
+            win = views[i, j]
+            kind = window_kind(win)
+            if kind == "nodata" or (kind == "constant" and constant_value is not None):
+                if kind == "constant":
+                    out[:n_features, i, j] = constant_value
+                flags[SKIPPED, i, j] = 1
+                continue
+            key = cache.key(win) if cache_size else None
+            value = cache.get(key) if cache_size else None
+            if value is None:
+                value = np.asarray(func(win), dtype=np.float32).reshape(n_features)
+                cache.put(key, value)
+            else:
+                flags[CACHE_HIT, i, j] = 1
+            out[:n_features, i, j] = value
+    return out
+
+
+# ---- Engine ------------------------------------------------------------------
+
+
+def _open_dem(dem, chunks: int):
+    """Return (DataArray, dask array) for a path or DataArray input."""
+    import dask.array as da
+    import xarray as xr
+
+    if isinstance(dem, (str, Path)):
+        import rioxarray as rxr
+
+        dem = rxr.open_rasterio(dem, masked=True, chunks={"x": chunks, "y": chunks})
+        dem = dem.squeeze("band", drop=True)
+    if not isinstance(dem, xr.DataArray):
+        raise TypeError(f"Expected a raster path or xarray.DataArray, got {type(dem).__name__}")
+    if dem.ndim != 2:
+        raise ValueError(f"Expected a 2D DEM, got dims {dem.dims}")
+
+    data = dem.data
+    if not isinstance(data, da.Array):
+        data = da.from_array(data, chunks=chunks)
+    data = data.astype(np.float64)
+    return dem, data
+
+
+def _coarse_coords(coord: np.ndarray, n_cells: int, stride: int) -> np.ndarray:
+    """Centre coordinates of stride-sized cells along a regular source axis."""
+    step = float(coord[1] - coord[0]) if coord.size > 1 else 1.0
+    offsets = np.arange(n_cells) * stride + (stride - 1) / 2.0
+    return float(coord[0]) + offsets * step
+
+
+def _aligned_chunks(size: int, chunk: int, halo: int) -> tuple:
+    """Stride-multiple chunks along one axis; a tail shorter than the halo joins its neighbour."""
+    chunks = [chunk] * (size // chunk)
+    tail = size - chunk * len(chunks)
+    if tail:
+        if chunks and tail < halo:
+            chunks[-1] += tail
+        else:
+            chunks.append(tail)
+    return tuple(chunks)
+
+
+# dask overlap boundary names -> np.pad modes (dask's 'reflect' repeats the edge)
+_PAD_MODES = {"reflect": "symmetric", "nearest": "edge", "periodic": "wrap"}
+
+
+def _overlap(data, halo: int, boundary=np.nan):
+    """
+    Overlap a 2D dask array by `halo` on both axes.
+
+    dask.overlap rejects arrays shorter than the depth, and an axis held in
+    one chunk has nothing to share anyway, so such axes are padded block by
+    block with `boundary` instead (a dask boundary name or a constant).
+    """
+    import dask.array as da
+
+    single = [axis for axis in (0, 1) if data.numblocks[axis] == 1]
+    haloed = da.overlap.overlap(
+        data, depth={axis: 0 if axis in single else halo for axis in (0, 1)}, boundary=boundary,
+    )
+    if not single:
+        return haloed
+    pad = [(halo, halo) if axis in single else (0, 0) for axis in (0, 1)]
+    if isinstance(boundary, str):
+        pad_block = partial(np.pad, pad_width=pad, mode=_PAD_MODES[boundary])
+    else:
+        pad_block = partial(np.pad, pad_width=pad, mode="constant", constant_values=boundary)
+    return haloed.map_blocks(
+        pad_block, dtype=haloed.dtype,
+        chunks=tuple(tuple(c + sum(p) for c in cs) for cs, p in zip(haloed.chunks, pad)),
+    )
+
+
+def _prepare_windows(dem, window: int, stride: int, halo: Optional[int], chunk_size: int):
+    """
+    Validate window geometry and build the haloed, stride-aligned dask array.
+
+    Returns (src, haloed, cell_chunks, coords, halo): the source DataArray,
+    the overlapped dask array, per-axis chunk sizes in output cells, centre
+    coordinates of the output cells, and the resolved halo.
+    """
+    import dask.array as da
+
+    if window < 1 or stride < 1:
+        raise ValueError("window and stride must be positive")
+    if stride > window:
+        raise ValueError(f"stride ({stride}) must not exceed window ({window})")
+    if (window - stride) % 2:
+        raise ValueError(
+            f"window - stride must be even so windows centre on output cells "
+            f"(got window={window}, stride={stride})"
+        )
+    depth = (window - stride) // 2
+    halo = depth if halo is None else int(halo)
+    if halo < depth:
+        raise ValueError(f"halo={halo} is smaller than the required overlap {depth}")
+
+    chunk = max(stride, int(round(chunk_size / stride)) * stride)
+    # dask.overlap rechunks blocks smaller than the depth behind our back,
+    # which would break the stride-cell chunk bookkeeping below
+    min_chunk = math.ceil(halo / stride) * stride
+    if chunk < min_chunk:
+        log.info("Raising chunk size %d to %d to cover the halo (%d)", chunk, min_chunk, halo)
+        chunk = min_chunk
+    src, data = _open_dem(dem, chunk)
+    ny_src, nx_src = data.shape
+    ny = math.ceil(ny_src / stride)
+    nx = math.ceil(nx_src / stride)
+
+    # Pad to whole stride cells and re-chunk on stride multiples
+    pad = ((0, ny * stride - ny_src), (0, nx * stride - nx_src))
+    if any(p[1] for p in pad):
+        data = da.pad(data, pad, mode="constant", constant_values=np.nan)
+    data = data.rechunk(tuple(_aligned_chunks(n * stride, chunk, halo) for n in (ny, nx)))
+
+    log.info(
+        "Sliding-window TDA: %dx%d px -> %dx%d cells (window=%d, stride=%d, halo=%d, %d chunks)",
+        ny_src, nx_src, ny, nx, window, stride, halo, data.npartitions,
+    )
+
+    haloed = _overlap(data, halo)
+    cell_chunks = (
+        tuple(c // stride for c in data.chunks[0]),
+        tuple(c // stride for c in data.chunks[1]),
+    )
+    coords = {
+        "y": _coarse_coords(np.asarray(src["y"]), ny, stride),
+        "x": _coarse_coords(np.asarray(src["x"]), nx, stride),
+    }
+    return src, haloed, cell_chunks, coords, halo
+
+
+def _attach_crs(out, src):
+    """Copy the source CRS (when rioxarray is available) and mark NaN as nodata."""
+    try:
+        import rioxarray  # noqa: F401  (registers the .rio accessor)
+        crs = src.rio.crs
+    except ImportError:
+        crs = None
+    if crs is not None:
+        out = out.rio.write_crs(crs)
+        out = out.rio.write_nodata(np.nan, encoded=False)
+    return out
+
+
+def _run_engine(
+    dem,
+    window: int,
+    stride: int,
+    kernel: Callable[..., np.ndarray],
+    halo: Optional[int],
+    n_features: int,
+    chunk_size: int,
+    out_path: Optional[Union[str, Path]],
+    scheduler: Optional[str],
+    compute: bool,
+    skip=None,
+):
+    """
+    Map a block kernel (block, window, stride, halo) -> (n_features + N_FLAGS, ny, nx).
+
+    `skip` is an optional boolean (ny, nx) array on the output cell grid; the
+    kernel then receives its block of it as a second positional argument.
+    Skip and cache-hit rates from the flag channels are logged and stored in
+    the 'tda_skip_rate' / 'tda_cache_hit_rate' attrs when computing.
+    """
+    import dask
+    import dask.array as da
+    import xarray as xr
+
+    if out_path is not None and not compute:
+        raise ValueError("out_path requires compute=True")
+    src, haloed, cell_chunks, coords, halo = _prepare_windows(
+        dem, window, stride, halo, chunk_size,
+    )
+    kernel = partial(kernel, window=window, stride=stride, halo=halo)
+    arrays = [haloed]
+    if skip is not None:
+        arrays.append(da.asarray(skip).rechunk(cell_chunks))
+    result = da.map_blocks(
+        kernel, *arrays, dtype=np.float32,
+        chunks=((n_features + N_FLAGS,),) + cell_chunks, new_axis=0,
+    )
+    flag_counts = result[n_features:].sum(axis=(1, 2))
+    result = result[:n_features]
+
+    if n_features == 1:
+        out = xr.DataArray(result[0], dims=("y", "x"), coords=coords, name="tda_summary")
+    else:
+        coords["band"] = np.arange(1, n_features + 1)
+        out = xr.DataArray(result, dims=("band", "y", "x"), coords=coords, name="tda_summary")
+    out.attrs.update({"tda_window": window, "tda_stride": stride, "tda_halo": halo})
+    out = _attach_crs(out, src)
+
+    if not compute:
+        return out
+    out, flag_counts = dask.compute(out, flag_counts, scheduler=scheduler)
+    n_cells = max(out.shape[-2] * out.shape[-1], 1)
+    out.attrs["tda_skip_rate"] = float(flag_counts[SKIPPED]) / n_cells
+    out.attrs["tda_cache_hit_rate"] = float(flag_counts[CACHE_HIT]) / n_cells
+    log.info(
+        "Sliding-window TDA: %.1f%% windows skipped, %.1f%% cache hits",
+        100 * out.attrs["tda_skip_rate"], 100 * out.attrs["tda_cache_hit_rate"],
+    )
+
+    if out_path is not None:
+        out_path = Path(out_path)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        out.rio.to_raster(out_path, tiled=True, compress="LZW")
+        log.info("Wrote %s", out_path)
+    return out
+
+
+def sliding_window_tda(
+    dem,
+    window: int,
+    stride: int,
+    func: Optional[WindowFunc] = None,
+    halo: Optional[int] = None,
+    n_features: int = 1,
+    chunk_size: int = 2048,
+    out_path: Optional[Union[str, Path]] = None,
+    scheduler: Optional[str] = None,
+    compute: bool = True,
+    cache_size: int = 4096,
+    quantum: Optional[float] = None,
+    constant_value: Optional[float] = None,
+):
+    """
+    Run a per-window persistence function over a DEM on a strided grid.
+
+    Each output cell covers a stride x stride block of source pixels and holds
+    `func` evaluated on the window x window neighbourhood centred on that
+    block. Chunks are read once with a `halo`-pixel overlap, so windows that
+    straddle chunk edges see the true neighbouring pixels; the raster edge is
+    padded with NaN (nodata).
+
+    All-nodata windows are skipped, and repeated window content is answered
+    from a per-chunk LRU cache keyed by a content hash (see
+    `geo_tda.tda.window_cache`); the computed DataArray reports the rates in
+    its 'tda_skip_rate' and 'tda_cache_hit_rate' attrs.
+
+    Args:
+        dem: DEM path (opened with rioxarray, nodata masked) or 2D DataArray
+            with regular 'y'/'x' coordinates.
+        window: Window size in pixels.
+        stride: Output cell size in pixels; (window - stride) must be even.
+        func: Per-window function returning a scalar or `n_features` values.
+            Defaults to `pit_persistence`. Must be picklable for
+            process-based schedulers.
+        halo: Overlap read from neighbouring chunks. Defaults to the minimum,
+            (window - stride) // 2.
+        n_features: Number of values returned by `func`.
+        chunk_size: Target chunk edge in pixels (rounded to a stride multiple).
+        out_path: Optional GeoTIFF path for the summary raster.
+        scheduler: Dask scheduler name ('threads', 'processes', 'sync');
+            None uses the active default (e.g. a distributed Client).
+        compute: If False, return the lazy DataArray without computing
+            (out_path must then be None).
+        cache_size: Results memoized per chunk (0 disables the cache).
+        quantum: Height step used to quantize cache keys; None keys on exact
+            values, so cached results are identical to recomputed ones.
+        constant_value: Value returned for flat (constant) windows without
+            calling `func`; None evaluates them like any other window.
+
+    Returns:
+        DataArray of summaries with dims ('y', 'x'), or ('band', 'y', 'x')
+        when n_features > 1, on the stride-decimated source grid.
+    """
+    kernel = partial(
+        _window_block, func=func or pit_persistence, n_features=n_features,
+        cache_size=cache_size, quantum=quantum, constant_value=constant_value,
+    )
+    return _run_engine(
+        dem, window, stride, kernel, halo, n_features, chunk_size, out_path, scheduler, compute,
+    )
+
+
+def sliding_window_summary(
+    dem,
+    window: int,
+    stride: int,
+    stat: str = "total",
+    dim: int = 0,
+    invert: bool = False,
+    min_valid: int = 10,
+    min_persistence: float = 0.0,
+    incremental: bool = True,
+    halo: Optional[int] = None,
+    chunk_size: int = 2048,
+    out_path: Optional[Union[str, Path]] = None,
+    scheduler: Optional[str] = None,
+    compute: bool = True,
+    cache_size: int = 4096,
+    quantum: Optional[float] = None,
+):
+    """
+    Sliding-window `persistence_summary` raster with the incremental kernel.
+
+    Produces the same values as `sliding_window_tda` with
+    `func=partial(persistence_summary, stat=..., dim=..., invert=...)`, but
+    by default slides each window row's sorted pixel order instead of
+    re-sorting every window (see `geo_tda.tda.incremental`). Only the sort
+    is shared between windows, so the gain is modest (about 1.4x at window
+    64 / stride 8) and grows slowly with window / stride.
+
+    Args:
+        dem: DEM path or 2D DataArray (see `sliding_window_tda`).
+        window: Window size in pixels.
+        stride: Output cell size in pixels; (window - stride) must be even.
+        stat: 'total', 'max', 'count' or 'entropy'.
+        dim: Homology dimension, 0 or 1.
+        invert: Summarise ridges (superlevel sets) instead of pits.
+        min_valid: Windows with fewer valid pixels are NaN.
+        min_persistence: Ignore pairs with shorter lifetimes (tau).
+        incremental: Slide sorted orders along rows; False evaluates every
+            window independently.
+        halo, chunk_size, out_path, scheduler, compute, cache_size, quantum:
+            As in `sliding_window_tda`. Flat windows are always answered
+            directly (0.0).
+
+    Returns:
+        DataArray of summaries with dims ('y', 'x').
+    """
+    if incremental:
+        kernel = partial(
+            incremental_block, stat=stat, dim=dim, invert=invert, min_valid=min_valid,
+            min_persistence=min_persistence, cache_size=cache_size, quantum=quantum,
+        )
+    else:
+        func = partial(
+            persistence_summary, stat=stat, dim=dim, invert=invert, min_valid=min_valid,
+            min_persistence=min_persistence,
+        )
+        kernel = partial(
+            _window_block, func=func, n_features=1, cache_size=cache_size, quantum=quantum,
+        )
+    return _run_engine(
+        dem, window, stride, kernel, halo, 1, chunk_size, out_path, scheduler, compute,
+    )
+
+
+__all__ = [
+    'sliding_window_tda',
+    'sliding_window_summary',
+    'lower_star_diagram',
+    'persistence_summary',
+    'pit_persistence',
+    'ridge_persistence',
+    'loop_persistence',
+]
@@ -4,6 +4,7 @@ General utility functions for logging, coordinates, and system resources.
 
 from .coords import get_bbox_from_key, get_key_from_sw_corner
 from .logging import setup_colored_logging
+from .jit import njit, HAS_NUMBA
 from .gpu_detection import (
     detect_gpu_config,
     get_compute_backend,
@@ -24,4 +25,7 @@ __all__ = [
     'check_cupy_available',
     'get_system_compute_resources',
     'print_compute_summary',
+    # Optional JIT
+    'njit',
+    'HAS_NUMBA',
 ]
\ No newline at end of file
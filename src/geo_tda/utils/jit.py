@@ -0,0 +1,30 @@
+"""
+Optional Numba JIT compilation for pixel-loop kernels.
+
+Kernels decorated with `njit` are compiled when Numba is installed and run as
+plain Python otherwise, so results are identical and only speed differs.
+"""
+
+import logging
+
+log = logging.getLogger(__name__)
+
+try:
+    from numba import njit as _numba_njit
+    HAS_NUMBA = True
+except ImportError:
+    _numba_njit = None
+    HAS_NUMBA = False
+
+
+def njit(*args, **kwargs):
+    """
+    `numba.njit` when available, otherwise a no-op decorator.
+
+    Supports both bare (`@njit`) and parameterised (`@njit(cache=True)`) use.
+    """
+    if HAS_NUMBA:
+        return _numba_njit(*args, **kwargs)
+    if len(args) == 1 and callable(args[0]) and not kwargs:
+        return args[0]
+    return lambda func: func